@@ -3,15 +3,20 @@
 from typing import Dict, List, Any, Optional, Union
 from uuid import UUID
 from datetime import datetime
+import asyncio
+import hashlib
 import logging
 
 from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, status
 from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from pydantic import BaseModel, Field, ConfigDict
 
 from app.core.security import get_current_active_user
-from app.db.models import Workflow, WorkflowExecution, ExecutionLog, User, Template
-from app.db.session import get_db
+from app.db.models import Workflow, WorkflowExecution, ExecutionLog, LogContent, User, Template
+from app.db.session import get_db, SessionLocal
 from app.engine.agentic_workflow_engine import AgenticWorkflowEngine
 from app.engine.agent_prompt_creator import AgentPromptCreator
 from app.engine.agent_decision_parser import AgentDecisionParser
@@ -254,6 +259,13 @@ async def delete_workflow(
             detail="Not enough permissions",
         )
     
+    # Logs of the workflow's executions go with it; shared output contents are
+    # kept while any other execution log still references them
+    execution_ids = db.query(WorkflowExecution.id).filter(WorkflowExecution.workflow_id == workflow_id)
+    db.query(ExecutionLog).filter(ExecutionLog.execution_id.in_(execution_ids)).delete(synchronize_session=False)
+    db.query(WorkflowExecution).filter(WorkflowExecution.workflow_id == workflow_id).delete(synchronize_session=False)
+    _prune_log_contents(db)
+    
     db.delete(workflow)
     db.commit()
     
@@ -380,6 +392,7 @@ async def get_execution(
     
     # Get logs for the execution
     logs = db.query(ExecutionLog).filter(ExecutionLog.execution_id == execution_id).order_by(ExecutionLog.timestamp).all()
+    _resolve_log_contents(db, logs)
     execution.logs = logs
     
     return execution
@@ -534,6 +547,159 @@ async def validate_workflow(
             "message": f"Validation error: {str(e)}"
         }
 
+# Maximum number of log rows written per bulk insert
+MAX_LOG_BATCH = 500
+
+def _add_execution_result_logs(db: Session, execution_id: UUID, result: Dict[str, Any]) -> None:
+    """
+    Write the post-execution logs for a workflow result.
+    Rows are collected as mappings and inserted in bulk rather than one ORM object at a time.
+    """
+    rows = []
+    success = result.get("success", False)
+    execution_graph = result.get("execution_graph")
+    
+    if not success:
+        rows.append({
+            "execution_id": execution_id,
+            "level": "error",
+            "agent": "system",
+            "message": f"Workflow execution failed: {result.get('error', 'Unknown error')}",
+        })
+    
+    rows.append({
+        "execution_id": execution_id,
+        "level": "info",
+        "agent": "system",
+        "message": "Workflow execution completed",
+        "data": {
+            "success": success,
+            "execution_time": result.get("execution_time", 0)
+        }
+    })
+    
+    if execution_graph:
+        rows.append({
+            "execution_id": execution_id,
+            "level": "info",
+            "agent": "system",
+            "message": "Execution Graph",
+            "data": {"graph": execution_graph}
+        })
+    
+    # Agent outputs are also kept in the execution result, so log rows reference them by hash
+    # and each distinct output is stored once in log_contents
+    contents = {}
+    append_row = rows.append
+    blake2b = hashlib.blake2b
+    for agent_name, agent_output in result.get("outputs", {}).items():
+        if isinstance(agent_output, str):
+            content_hash = blake2b(agent_output.encode(), digest_size=16).hexdigest()
+            contents[content_hash] = agent_output
+            data = {"content_ref": content_hash}
+        else:
+            data = {"content": agent_output}
+        
+        append_row({
+            "execution_id": execution_id,
+            "level": "info",
+            "agent": agent_name,
+            "message": f"Agent output: {agent_name}",
+            "data": data
+        })
+    
+    if contents:
+        insert = sqlite_insert if db.get_bind().dialect.name == "sqlite" else pg_insert
+        db.execute(
+            insert(LogContent)
+            .values([{"hash": h, "content": c} for h, c in contents.items()])
+            .on_conflict_do_nothing(index_elements=["hash"])
+        )
+    
+    for start in range(0, len(rows), MAX_LOG_BATCH):
+        db.bulk_insert_mappings(ExecutionLog, rows[start:start + MAX_LOG_BATCH])
+
+def _resolve_log_contents(db: Session, logs: List[ExecutionLog]) -> None:
+    """Replace content_ref hashes in log data with the referenced content"""
+    refs = {log.data["content_ref"] for log in logs if log.data and "content_ref" in log.data}
+    if not refs:
+        return
+    
+    contents = dict(db.query(LogContent.hash, LogContent.content).filter(LogContent.hash.in_(refs)).all())
+    for log in logs:
+        if log.data and "content_ref" in log.data:
+            data = {key: value for key, value in log.data.items() if key != "content_ref"}
+            data["content"] = contents.get(log.data["content_ref"], "")
+            # Loaded rows are only rewritten for the response, not marked dirty
+            set_committed_value(log, "data", data)
+
+def _prune_log_contents(db: Session) -> int:
+    """Delete log_contents rows that no execution log references any more"""
+    referenced = db.query(ExecutionLog.data["content_ref"].as_string()).filter(
+        ExecutionLog.data["content_ref"].as_string().isnot(None)
+    )
+    return db.query(LogContent).filter(LogContent.hash.notin_(referenced)).delete(synchronize_session=False)
+
+# Queue of (execution_id, result) pairs whose logs are written by the log writer task
+LOG_QUEUE_SIZE = 1000
+LOG_WRITER_BATCH = 50
+_log_queue: "asyncio.Queue" = asyncio.Queue(maxsize=LOG_QUEUE_SIZE)
+_log_writer_task: Optional[asyncio.Task] = None
+
+def _write_queued_result_logs(items: List[tuple]) -> None:
+    """Write result logs for a batch of executions in one session and commit"""
+    db = SessionLocal()
+    try:
+        for execution_id, result in items:
+            _add_execution_result_logs(db, execution_id, result)
+        db.commit()
+    finally:
+        db.close()
+
+async def _log_writer() -> None:
+    """Drain the log queue, writing batches of result logs off the event loop"""
+    loop = asyncio.get_running_loop()
+    while True:
+        items = [await _log_queue.get()]
+        while len(items) < LOG_WRITER_BATCH and not _log_queue.empty():
+            items.append(_log_queue.get_nowait())
+        try:
+            await loop.run_in_executor(None, _write_queued_result_logs, items)
+        except Exception as e:
+            logger.exception(f"Error writing execution logs: {e}")
+        finally:
+            for _ in items:
+                _log_queue.task_done()
+
+def start_log_writer() -> None:
+    """Start the background execution log writer"""
+    global _log_writer_task
+    if _log_writer_task is None:
+        _log_writer_task = asyncio.create_task(_log_writer())
+
+async def stop_log_writer() -> None:
+    """Flush queued execution logs and stop the background writer"""
+    global _log_writer_task
+    if _log_writer_task is None:
+        return
+    await _log_queue.join()
+    _log_writer_task.cancel()
+    _log_writer_task = None
+
+def _enqueue_result_logs(execution_id: UUID, result: Dict[str, Any]) -> bool:
+    """
+    Hand result logs to the background writer.
+    Returns False if the writer isn't running or the queue is full, in which case the caller writes them itself.
+    """
+    if _log_writer_task is None:
+        return False
+    try:
+        _log_queue.put_nowait((execution_id, result))
+        return True
+    except asyncio.QueueFull:
+        logger.warning("Execution log queue is full, writing logs inline")
+        return False
+
 #
 # Background execution function
 #
@@ -580,11 +746,16 @@ async def execute_agentic_workflow_background(
             description=template.description,
             workflow_type=template.workflow_type,
             created_by_id=template.created_by_id,
+            updated_at=template.updated_at,
             config=AgentPromptCreator.enhance_template_with_agentic_capabilities(template.config)
         )
         
-        # Execute the workflow
-        result = await agentic_engine.execute_workflow(enhanced_template, workflow, input_data)
+        # Execute the workflow; clients can leave the per-agent usage summary out of the
+        # stored result with options.include_agent_usage = false
+        result = await agentic_engine.execute_workflow(
+            enhanced_template, workflow, input_data,
+            include_agent_usage=bool(options.get("include_agent_usage", True))
+        )
         
         # Update execution with result
         execution.completed_at = datetime.utcnow()
@@ -593,50 +764,11 @@ async def execute_agentic_workflow_background(
         
         if not result.get("success", False):
             execution.error = result.get("error", "Workflow execution failed")
-            
-            # Add error log
-            error_log = ExecutionLog(
-                execution_id=execution_id,
-                level="error",
-                agent="system",
-                message=f"Workflow execution failed: {result.get('error', 'Unknown error')}",
-            )
-            db.add(error_log)
         
-        # Add completion log
-        complete_log = ExecutionLog(
-            execution_id=execution_id,
-            level="info",
-            agent="system",
-            message="Workflow execution completed",
-            data={
-                "success": result.get("success", False),
-                "execution_time": result.get("execution_time", 0)
-            }
-        )
-        db.add(complete_log)
-        
-        # Add execution graph if available
-        if result.get("execution_graph"):
-            graph_log = ExecutionLog(
-                execution_id=execution_id,
-                level="info",
-                agent="system",
-                message="Execution Graph",
-                data={"graph": result.get("execution_graph")}
-            )
-            db.add(graph_log)
-        
-        # Add agent logs
-        for agent_name, agent_output in result.get("outputs", {}).items():
-            agent_log = ExecutionLog(
-                execution_id=execution_id,
-                level="info",
-                agent=agent_name,
-                message=f"Agent output: {agent_name}",
-                data={"content": agent_output}
-            )
-            db.add(agent_log)
+        # Add result logs (error, completion, graph and per-agent outputs), queued for the
+        # log writer when it is running so the status update isn't held up by log inserts
+        if not _enqueue_result_logs(execution_id, result):
+            _add_execution_result_logs(db, execution_id, result)
         
         db.commit()
         
@@ -104,6 +104,12 @@ class ExecutionLog(Base):
     # Relationships
     execution = relationship("WorkflowExecution", back_populates="logs")
 
+class LogContent(Base):
+    __tablename__ = "log_contents"
+
+    hash = Column(String, primary_key=True)  # blake2b digest of the content
+    content = Column(Text, nullable=False)
+
 class VectorStore(Base):
     __tablename__ = "vector_stores"
 
@@ -212,6 +218,9 @@ from sqlalchemy import event, text
 
 @event.listens_for(Template.__table__, "after_create")
 def create_template_indexes(target, connection, **kw):
+    # The extension and trigram indexes are PostgreSQL-only (tests run on SQLite)
+    if connection.dialect.name != "postgresql":
+        return
     # First enable the pg_trgm extension
     connection.execute(text('CREATE EXTENSION IF NOT EXISTS pg_trgm;'))
     # Index for searching templates by name
@@ -221,6 +230,8 @@ def create_template_indexes(target, connection, **kw):
 
 @event.listens_for(WorkflowExecution.__table__, "after_create")
 def create_execution_indexes(target, connection, **kw):
+    if connection.dialect.name != "postgresql":
+        return
     # First enable the pg_trgm extension
     connection.execute(text('CREATE EXTENSION IF NOT EXISTS pg_trgm;'))    
     # Index for filtering executions by status
@@ -7,8 +7,21 @@ from sqlalchemy.orm import sessionmaker
 
 from app.core.config import settings
 
+# orjson is optional; without it JSON/JSONB columns use SQLAlchemy's default json.dumps
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+def _json_serializer(value) -> str:
+    """Serialize JSON column values (execution results, log data) with orjson"""
+    return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS).decode()
+
+engine_options = {"json_serializer": _json_serializer} if ORJSON_AVAILABLE else {}
+
 # Create SQLAlchemy engine
-engine = create_engine(settings.DATABASE_URL, pool_pre_ping=True)
+engine = create_engine(settings.DATABASE_URL, pool_pre_ping=True, **engine_options)
 
 # Create sessionmaker
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
@@ -31,7 +44,7 @@ from sqlalchemy.orm import sessionmaker
 
 # If an async database URL is provided, create an async engine
 if hasattr(settings, "ASYNC_DATABASE_URL") and settings.ASYNC_DATABASE_URL:
-    async_engine = create_async_engine(settings.ASYNC_DATABASE_URL)
+    async_engine = create_async_engine(settings.ASYNC_DATABASE_URL, **engine_options)
     AsyncSessionLocal = sessionmaker(
         autocommit=False, autoflush=False, bind=async_engine, class_=AsyncSession
     )
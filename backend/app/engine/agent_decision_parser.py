@@ -1,14 +1,138 @@
 # backend/app/engine/agent_decision_parser.py
 import re
+import json
 import logging
-from typing import Dict, Any, Optional, Union, List, Tuple
+import functools
+from typing import Dict, Any, Optional, Union, List, Tuple, Set
+
+# Aho-Corasick is optional; without it agent mentions are found with plain substring scans
+try:
+    import ahocorasick
+    AHOCORASICK_AVAILABLE = True
+except ImportError:
+    AHOCORASICK_AVAILABLE = False
+
+# orjson is optional; without it JSON decisions and tool parameters use the stdlib parser
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+# Both parsers raise ValueError subclasses on malformed input
+_json_loads = orjson.loads if ORJSON_AVAILABLE else json.loads
+
+# Action types a structured (JSON) decision may carry
+_JSON_ACTION_TYPES = frozenset(("delegate", "respond", "use_tool", "final"))
 
 logger = logging.getLogger(__name__)
 
+@functools.lru_cache(maxsize=128)
+def _build_agent_automaton(agent_names: Tuple[str, ...]):
+    """Build (and cache) an Aho-Corasick automaton over lower-cased agent names"""
+    automaton = ahocorasick.Automaton()
+    for name in agent_names:
+        automaton.add_word(name.lower(), name.lower())
+    automaton.make_automaton()
+    return automaton
+
+def find_mentioned_agents(content: str, agent_names: List[str]) -> Set[str]:
+    """
+    Find which agent names are mentioned in a piece of text (case-insensitive)
+    
+    Uses a single Aho-Corasick pass over the text when pyahocorasick is installed,
+    instead of one substring scan per agent.
+    
+    Args:
+        content: The text to search
+        agent_names: Candidate agent names
+        
+    Returns:
+        Set of agent names that occur in the text
+    """
+    names = tuple(name for name in agent_names if name)
+    if not names:
+        return set()
+    
+    lowered = content.lower()
+    if AHOCORASICK_AVAILABLE:
+        found = {match for _, match in _build_agent_automaton(names).iter(lowered)}
+        return {name for name in names if name.lower() in found}
+    
+    return {name for name in names if name.lower() in lowered}
+
+# Explicit [ACTION: ...] annotations and the delegation form of their action text
+_ACTION_RE = re.compile(r'\[ACTION:?\s*([^\]]+)\]', re.IGNORECASE)
+_DELEGATE_RE = re.compile(r'delegate(?:\s+to)?\s+([a-zA-Z0-9_]+)', re.IGNORECASE)
+
+def action_annotations_end(content: str) -> Optional[int]:
+    """
+    End of the line holding the last [ACTION: delegate ...] annotation in a (partial) response,
+    once the text continues past it with something other than another bracketed annotation;
+    None while more annotations could still follow or the response isn't a delegation
+    """
+    last_action = None
+    for last_action in _ACTION_RE.finditer(content):
+        pass
+    if last_action is None or not _DELEGATE_RE.search(last_action.group(1)):
+        return None
+    
+    line_end = content.find("\n", last_action.end())
+    if line_end == -1:
+        return None
+    rest = content[line_end + 1:].lstrip()
+    if not rest or rest.startswith("["):
+        return None
+    return line_end
+
+# [CONTENT: ...] payload of a delegation and [TOOL: name] ... [/TOOL] requests with their parameters
+_CONTENT_RE = re.compile(r'\[CONTENT:?\s*([^\]]+(?:\n(?!\[)[^\]]*)*)\]', re.DOTALL)
+_TOOL_RE = re.compile(r'\[TOOL:?\s*([^\]]+)\](.*?)(?:\[/TOOL\]|\Z)', re.DOTALL | re.IGNORECASE)
+_TOOL_PARAM_RE = re.compile(r'(\w+)\s*:\s*([^,\n]+)')
+
+# Phrases naming a tool the agent intends to use, tried in order
+_TOOL_USAGE_RES = tuple(re.compile(pattern) for pattern in (
+    r"(?i)I will use the ([a-zA-Z0-9_]+) tool",
+    r"(?i)Using the ([a-zA-Z0-9_]+) tool",
+    r"(?i)Let me ([a-zA-Z0-9_]+) this",
+    r"(?i)I'll ([a-zA-Z0-9_]+) this"
+))
+
+# Phrases indicating an agent considers its response final, matched in one pass
+_FINAL_PHRASE_RE = re.compile(
+    r"final\s+answer|in\s+conclusion|to\s+summarize|in\s+summary|my\s+final\s+response|the\s+answer\s+is",
+    re.IGNORECASE
+)
+
+# Words in an [ACTION: ...] annotation marking the response as final
+_FINAL_ACTION_RE = re.compile(r"final|complete|done|finish")
+
+@functools.lru_cache(maxsize=256)
+def _delegation_pattern(target_agent: str) -> "re.Pattern":
+    """Compile (and cache) one pattern matching any natural-language delegation phrase for an agent"""
+    phrases = [
+        rf"ask\s+{target_agent}",
+        rf"delegate\s+to\s+{target_agent}",
+        rf"let\s+{target_agent}",
+        rf"have\s+{target_agent}",
+        rf"{target_agent}\s+should",
+        rf"{target_agent}\s+will",
+        rf"{target_agent}\s+can",
+        rf"pass\s+to\s+{target_agent}",
+        rf"hand\s+(?:this|it)\s+(?:over|off)\s+to\s+{target_agent}"
+    ]
+    return re.compile("|".join(f"(?:{phrase})" for phrase in phrases), re.IGNORECASE)
+
 class AgentDecision:
     """
     Represents a decision made by an agent about what action to take next
     """
+    # One decision is created per agent turn; slots keep it small and its attributes fast
+    __slots__ = (
+        "agent_name", "action_type", "target", "content", "reasoning",
+        "tool_name", "tool_params", "targets"
+    )
+    
     def __init__(
         self,
         agent_name: str,
@@ -17,7 +141,8 @@ class AgentDecision:
         content: Optional[str] = None,
         reasoning: str = "",
         tool_name: Optional[str] = None,
-        tool_params: Optional[Dict[str, Any]] = None
+        tool_params: Optional[Dict[str, Any]] = None,
+        targets: Optional[List[str]] = None
     ):
         self.agent_name = agent_name
         self.action_type = action_type  # 'delegate', 'respond', 'use_tool', 'final'
@@ -26,6 +151,7 @@ class AgentDecision:
         self.reasoning = reasoning  # Reasoning behind the decision
         self.tool_name = tool_name  # Tool to use
         self.tool_params = tool_params or {}  # Parameters for the tool
+        self.targets = targets or ([target] if target else [])  # All delegation targets (fan-out)
     
     def to_dict(self) -> Dict[str, Any]:
         """Convert decision to dictionary"""
@@ -36,7 +162,8 @@ class AgentDecision:
             "content": self.content,
             "reasoning": self.reasoning,
             "tool_name": self.tool_name,
-            "tool_params": self.tool_params
+            "tool_params": self.tool_params,
+            "targets": self.targets
         }
     
     @classmethod
@@ -49,9 +176,61 @@ class AgentDecision:
             content=data.get("content"),
             reasoning=data.get("reasoning", ""),
             tool_name=data.get("tool_name"),
-            tool_params=data.get("tool_params", {})
+            tool_params=data.get("tool_params", {}),
+            targets=data.get("targets")
         )
 
+def _parse_json_decision(content: str, agent_name: str, context: Dict[str, Any]) -> Optional[AgentDecision]:
+    """
+    Fast path for responses that are a JSON decision object (as emitted by tool-calling
+    models), e.g. {"action_type": "delegate", "targets": [...], "content": "..."}.
+    Returns None when the response isn't such an object, so the regex strategies run instead.
+    """
+    if content.lstrip()[:1] != "{":
+        return None
+    try:
+        data = _json_loads(content)
+    except ValueError:
+        return None
+    if not isinstance(data, dict) or data.get("action_type") not in _JSON_ACTION_TYPES:
+        return None
+    
+    action_type = data["action_type"]
+    if action_type == "delegate":
+        available_agents = context.get("available_agents", [])
+        requested = data.get("targets") or ([data["target"]] if data.get("target") else [])
+        if not isinstance(requested, list) or not all(isinstance(target, str) for target in requested):
+            return None
+        targets = [target for target in dict.fromkeys(requested) if target in available_agents]
+        if not targets:
+            return None
+        return AgentDecision(
+            agent_name=agent_name,
+            action_type="delegate",
+            target=targets[0],
+            content=data.get("content") or content,
+            reasoning=data.get("reasoning") or f"Agent explicitly requested delegation to {', '.join(targets)}",
+            targets=targets
+        )
+    if action_type == "use_tool":
+        if not data.get("tool_name"):
+            return None
+        tool_params = data.get("tool_params")
+        return AgentDecision(
+            agent_name=agent_name,
+            action_type="use_tool",
+            tool_name=data["tool_name"],
+            tool_params=tool_params if isinstance(tool_params, dict) else {},
+            content=content,
+            reasoning=data.get("reasoning") or f"Agent explicitly requested to use tool: {data['tool_name']}"
+        )
+    return AgentDecision(
+        agent_name=agent_name,
+        action_type=action_type,
+        content=data.get("content") or content,
+        reasoning=data.get("reasoning") or "Agent returned a structured decision"
+    )
+
 class AgentDecisionParser:
     """
     Parses agent outputs to determine their intended actions and decisions
@@ -68,6 +247,7 @@ class AgentDecisionParser:
         Parse an agent's response to extract the next action decision
         
         This function tries multiple strategies to determine what the agent wants to do next:
+        0. Accept a structured JSON decision object as-is
         1. Look for explicit action annotations like [ACTION: target]
         2. Look for explicit tool usage like [TOOL: tool_name]
         3. Parse natural language to infer the intention
@@ -90,13 +270,22 @@ class AgentDecisionParser:
         )
         
         try:
+            # Strategy 0: Structured JSON decision (first-character check keeps this free for prose)
+            json_decision = _parse_json_decision(content, agent_name, context)
+            if json_decision is not None:
+                return json_decision
+            
+            # Bracketed [ACTION]/[TOOL] annotations need a "["; a plain substring check
+            # skips both case-insensitive regex scans for the common unannotated response
+            has_annotations = "[" in content
+            
             # Strategy 1: Look for explicit action annotations
-            action_match = re.search(r'\[ACTION:?\s*([^\]]+)\]', content, re.IGNORECASE)
+            action_match = _ACTION_RE.search(content) if has_annotations else None
             if action_match:
                 action = action_match.group(1).strip().lower()
                 
                 # Check if it's a delegation to a specific agent
-                delegate_match = re.search(r'delegate(?:\s+to)?\s+([a-zA-Z0-9_]+)', action, re.IGNORECASE)
+                delegate_match = _DELEGATE_RE.search(action)
                 if delegate_match:
                     target_agent = delegate_match.group(1).strip()
                     
@@ -104,20 +293,30 @@ class AgentDecisionParser:
                     available_agents = context.get("available_agents", [])
                     if target_agent in available_agents:
                         # Get content to send to the target agent
-                        content_match = re.search(r'\[CONTENT:?\s*([^\]]+(?:\n(?!\[)[^\]]*)*)\]', content, re.DOTALL)
+                        content_match = _CONTENT_RE.search(content)
                         content_to_send = content_match.group(1).strip() if content_match else content
                         
+                        # Further delegation annotations fan the same content out to several agents
+                        targets = [target_agent]
+                        for other_action in _ACTION_RE.finditer(content, action_match.end()):
+                            other_match = _DELEGATE_RE.search(other_action.group(1).strip().lower())
+                            if other_match:
+                                other_target = other_match.group(1).strip()
+                                if other_target in available_agents and other_target not in targets:
+                                    targets.append(other_target)
+                        
                         decision = AgentDecision(
                             agent_name=agent_name,
                             action_type="delegate",
                             target=target_agent,
                             content=content_to_send,
-                            reasoning=f"Agent explicitly requested delegation to {target_agent}"
+                            reasoning=f"Agent explicitly requested delegation to {', '.join(targets)}",
+                            targets=targets
                         )
                         return decision
                 
                 # Check if it's a final response
-                if any(word in action for word in ["final", "complete", "done", "finish"]):
+                if _FINAL_ACTION_RE.search(action):
                     decision = AgentDecision(
                         agent_name=agent_name,
                         action_type="final",
@@ -127,23 +326,25 @@ class AgentDecisionParser:
                     return decision
             
             # Strategy 2: Look for explicit tool usage
-            tool_match = re.search(r'\[TOOL:?\s*([^\]]+)\](.*?)(?:\[/TOOL\]|\Z)', content, re.DOTALL | re.IGNORECASE)
+            tool_match = _TOOL_RE.search(content) if has_annotations else None
             if tool_match:
                 tool_name = tool_match.group(1).strip()
                 tool_params_str = tool_match.group(2).strip()
                 
                 # Get tool parameters as JSON if possible
-                import json
-                tool_params = {}
-                try:
-                    # Clean up the parameters string to extract JSON
-                    params_str = tool_params_str.strip()
-                    if params_str:
-                        # Try to parse as JSON
-                        tool_params = json.loads(params_str)
-                except json.JSONDecodeError:
+                tool_params = None
+                # Clean up the parameters string to extract JSON
+                params_str = tool_params_str.strip()
+                if params_str[:1] in ("{", "["):
+                    # Try to parse as JSON
+                    try:
+                        tool_params = _json_loads(params_str)
+                    except ValueError:
+                        pass
+                if tool_params is None:
                     # If not valid JSON, extract parameters heuristically
-                    param_matches = re.findall(r'(\w+)\s*:\s*([^,\n]+)', tool_params_str)
+                    tool_params = {}
+                    param_matches = _TOOL_PARAM_RE.findall(tool_params_str)
                     for key, value in param_matches:
                         tool_params[key.strip()] = value.strip()
                 
@@ -160,68 +361,45 @@ class AgentDecisionParser:
             # Strategy 3: Parse natural language intentions
             # Look for phrases like "I'll ask [agent]" or "Let's delegate to [agent]"
             available_agents = context.get("available_agents", [])
+            
+            # Only agents actually named in the response can match a delegation phrase
+            mentioned_agents = find_mentioned_agents(content, available_agents)
             for target_agent in available_agents:
                 # Skip the current agent
                 if target_agent == agent_name:
                     continue
                 
-                # Look for delegation phrases
-                delegation_patterns = [
-                    rf"(?i)ask\s+{target_agent}",
-                    rf"(?i)delegate\s+to\s+{target_agent}",
-                    rf"(?i)let\s+{target_agent}",
-                    rf"(?i)have\s+{target_agent}",
-                    rf"(?i){target_agent}\s+should",
-                    rf"(?i){target_agent}\s+will",
-                    rf"(?i){target_agent}\s+can",
-                    rf"(?i)pass\s+to\s+{target_agent}",
-                    rf"(?i)hand\s+(this|it)\s+(?:over|off)\s+to\s+{target_agent}"
-                ]
+                # Names containing regex metacharacters are matched as patterns, so keep them
+                if target_agent not in mentioned_agents and re.escape(target_agent) == target_agent:
+                    continue
                 
-                for pattern in delegation_patterns:
-                    if re.search(pattern, content):
-                        decision = AgentDecision(
-                            agent_name=agent_name,
-                            action_type="delegate",
-                            target=target_agent,
-                            content=content,
-                            reasoning=f"Agent implicitly indicated delegation to {target_agent} through natural language"
-                        )
-                        return decision
-            
-            # Look for phrases indicating final response
-            final_patterns = [
-                r"(?i)final\s+answer",
-                r"(?i)in\s+conclusion",
-                r"(?i)to\s+summarize",
-                r"(?i)in\s+summary",
-                r"(?i)my\s+final\s+response",
-                r"(?i)the\s+answer\s+is"
-            ]
-            
-            for pattern in final_patterns:
-                if re.search(pattern, content):
+                # Look for delegation phrases
+                if _delegation_pattern(target_agent).search(content):
                     decision = AgentDecision(
                         agent_name=agent_name,
-                        action_type="final",
+                        action_type="delegate",
+                        target=target_agent,
                         content=content,
-                        reasoning="Agent used language indicating a final response"
+                        reasoning=f"Agent implicitly indicated delegation to {target_agent} through natural language"
                     )
                     return decision
             
-            # Look for patterns indicating tool usage
-            tool_usage_patterns = [
-                r"(?i)I will use the ([a-zA-Z0-9_]+) tool",
-                r"(?i)Using the ([a-zA-Z0-9_]+) tool",
-                r"(?i)Let me ([a-zA-Z0-9_]+) this",
-                r"(?i)I'll ([a-zA-Z0-9_]+) this"
-            ]
+            # Look for phrases indicating final response
+            if _FINAL_PHRASE_RE.search(content):
+                decision = AgentDecision(
+                    agent_name=agent_name,
+                    action_type="final",
+                    content=content,
+                    reasoning="Agent used language indicating a final response"
+                )
+                return decision
             
-            for pattern in tool_usage_patterns:
-                tool_usage_match = re.search(pattern, content)
+            # Look for patterns indicating tool usage (only possible when the agent has tools)
+            tools_available = context.get("tools_available", [])
+            for pattern in _TOOL_USAGE_RES if tools_available else ():
+                tool_usage_match = pattern.search(content)
                 if tool_usage_match:
                     potential_tool = tool_usage_match.group(1).strip().lower()
-                    tools_available = context.get("tools_available", [])
                     
                     # Check if this matches an available tool
                     for tool in tools_available:
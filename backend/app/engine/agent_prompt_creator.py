@@ -2,9 +2,26 @@
 from typing import Dict, List, Any, Optional, Union
 import logging
 import json
+import string
+import functools
+import re
 
 logger = logging.getLogger(__name__)
 
+_formatter = string.Formatter()
+
+# A plain {name} placeholder, as replaced by fill_placeholders
+_PLACEHOLDER_RE = re.compile(r"\{(\w+)\}")
+
+class SafeDict(dict):
+    """
+    Mapping for str.format_map that leaves unknown placeholders untouched,
+    matching the behaviour of a chain of str.replace calls.
+    """
+    
+    def __missing__(self, key: str) -> str:
+        return "{" + key + "}"
+
 class AgentPromptCreator:
     """
     Creates prompts for agents with agentic capabilities such as
@@ -265,6 +282,83 @@ Your final answer or conclusion here.
             
         return "\n".join(instructions)
     
+    @staticmethod
+    def fill_placeholders(prompt_template: str, **values: Any) -> str:
+        """
+        Fill {placeholders} in a prompt template in a single pass.
+        
+        Args:
+            prompt_template: The prompt template
+            values: Placeholder values keyed by placeholder name
+            
+        Returns:
+            Prompt with known placeholders replaced and unknown ones left as-is
+        """
+        # Only plain {name} fields go through format_map; literal braces (e.g. JSON
+        # examples), format specs and escapes fall back to per-placeholder replacement
+        if AgentPromptCreator._is_plain_template(prompt_template):
+            return prompt_template.format_map(SafeDict(values))
+        
+        prompt = prompt_template
+        for key, value in values.items():
+            prompt = prompt.replace("{" + key + "}", str(value))
+        return prompt
+    
+    @staticmethod
+    def compile_placeholders(prompt_template: str) -> tuple:
+        """
+        Split a prompt template into literal text and placeholder names, once.
+        
+        Args:
+            prompt_template: The prompt template
+            
+        Returns:
+            Tuple alternating literal chunks (even indices) and placeholder names (odd indices)
+        """
+        return tuple(_PLACEHOLDER_RE.split(prompt_template))
+    
+    @staticmethod
+    def render_placeholders(chunks: tuple, values: Dict[str, Any]) -> str:
+        """
+        Fill a template compiled with compile_placeholders in a single join.
+        
+        Args:
+            chunks: The compiled template
+            values: Placeholder values keyed by placeholder name
+            
+        Returns:
+            Prompt with known placeholders replaced and unknown ones left as-is
+        """
+        parts = list(chunks)
+        for index in range(1, len(parts), 2):
+            key = parts[index]
+            parts[index] = str(values[key]) if key in values else "{" + key + "}"
+        return "".join(parts)
+    
+    @staticmethod
+    @functools.lru_cache(maxsize=256)
+    def _is_plain_template(prompt_template: str) -> bool:
+        """
+        Check whether a template only uses plain {name} placeholders.
+        
+        Args:
+            prompt_template: The prompt template to check
+            
+        Returns:
+            Whether the template can be filled with str.format_map
+        """
+        if "{{" in prompt_template or "}}" in prompt_template:
+            return False
+        
+        try:
+            return all(
+                field.isidentifier() and not format_spec and conversion is None
+                for _, field, format_spec, conversion in _formatter.parse(prompt_template)
+                if field is not None
+            )
+        except ValueError:
+            return False
+    
     @staticmethod
     def format_runtime_placeholders(
         prompt: str,
@@ -294,22 +388,23 @@ Your final answer or conclusion here.
         
         # Replace {available_tools} with actual tool information
         if '{available_tools}' in formatted_prompt and available_tools:
-            tools_text = "Available tools:\n"
+            tools_parts = ["Available tools:\n"]
             for tool in available_tools:
-                tools_text += f"- {tool['name']}: {tool['description']}\n"
-                tools_text += f"  Parameters: {json.dumps(tool['parameters'])}\n"
-            formatted_prompt = formatted_prompt.replace('{available_tools}', tools_text)
+                tools_parts.append(f"- {tool['name']}: {tool['description']}\n")
+                tools_parts.append(f"  Parameters: {json.dumps(tool['parameters'])}\n")
+            formatted_prompt = formatted_prompt.replace('{available_tools}', "".join(tools_parts))
         
         # Replace {previous_decisions} with actual decision history
         if '{previous_decisions}' in formatted_prompt and previous_decisions:
-            decisions_text = "Previous decisions:\n"
+            decisions_parts = ["Previous decisions:\n"]
             for i, decision in enumerate(previous_decisions):
-                decisions_text += f"{i+1}. Agent '{decision['agent']}' decided to {decision['action']}"
+                decisions_parts.append(f"{i+1}. Agent '{decision['agent']}' decided to {decision['action']}")
                 if decision['action'] == 'delegate' and decision.get('target'):
-                    decisions_text += f" to {decision['target']}"
+                    decisions_parts.append(f" to {decision['target']}")
                 elif decision['action'] == 'use_tool' and decision.get('tool_name'):
-                    decisions_text += f" tool '{decision['tool_name']}'"
-                decisions_text += "\n"
+                    decisions_parts.append(f" tool '{decision['tool_name']}'")
+                decisions_parts.append("\n")
+            decisions_text = "".join(decisions_parts)
             formatted_prompt = formatted_prompt.replace('{previous_decisions}', decisions_text)
         
         return formatted_prompt
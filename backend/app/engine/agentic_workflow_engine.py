@@ -3,10 +3,12 @@ import logging
 import json
 import asyncio
 import os
+import time
 from typing import Dict, List, Any, Optional, Union, TypedDict, Annotated, Literal, cast
 from datetime import datetime
 import uuid
 from pathlib import Path
+from collections import deque, OrderedDict
 import inspect
 
 from pydantic import BaseModel, Field
@@ -20,12 +22,32 @@ from app.core.config import settings
 from app.db.models import Template, Workflow, WorkflowExecution, ExecutionLog
 from app.engine.tools.enhanced_rag_tool import EnhancedRAGTool
 from app.db.vector_store import VectorStoreManager
-from app.engine.langgraph_workflow_runner import LangGraphWorkflowRunner
+from app.engine.langgraph_workflow_runner import LangGraphWorkflowRunner, close_checkpointers
 from app.engine.agent_prompt_creator import AgentPromptCreator
 from app.engine.agent_decision_parser import AgentDecisionParser
+from app.engine.optimizations import LRUCache, ensure_dir
 
 logger = logging.getLogger(__name__)
 
+# Merged template/workflow configs keyed by the ids and update times of both rows.
+# Cached configs are shared between executions and must be treated as read-only.
+merged_config_cache: LRUCache[Dict[str, Any]] = LRUCache(max_size=256)
+
+# Idle workflow runners under the same keys. A runner keeps its compiled graph and checkpointer
+# between executions and runs one execution at a time, so concurrent requests for the same
+# workflow each take their own runner.
+MAX_IDLE_RUNNERS_PER_WORKFLOW = 4
+MAX_POOLED_WORKFLOWS = 64
+_idle_runners: "OrderedDict[str, List[LangGraphWorkflowRunner]]" = OrderedDict()
+
+async def close_idle_runners() -> None:
+    """Release all pooled workflow runners and close the shared checkpoint connections"""
+    while _idle_runners:
+        _, runners = _idle_runners.popitem(last=False)
+        for runner in runners:
+            await runner.aclose()
+    await close_checkpointers()
+
 class AgenticWorkflowEngine:
     """
     Enhanced workflow engine that uses LangGraph for dynamic agentic decision making
@@ -46,39 +68,51 @@ class AgenticWorkflowEngine:
         
         # Additional configuration
         self.checkpoint_dir = settings.CHECKPOINT_DIR
-        os.makedirs(self.checkpoint_dir, exist_ok=True)
+        ensure_dir(self.checkpoint_dir)
 
-    async def execute_workflow(self, template: Template, workflow: Workflow, input_data: Dict[str, Any]) -> Dict[str, Any]:
+    async def execute_workflow(
+        self,
+        template: Template,
+        workflow: Workflow,
+        input_data: Dict[str, Any],
+        include_agent_usage: bool = True
+    ) -> Dict[str, Any]:
         """Execute a workflow with the given input data using its template with agentic capabilities"""
         logger.info(f"Executing agentic workflow: {workflow.name} (ID: {workflow.id})")
         
-        start_time = datetime.now()
+        start_time = time.perf_counter()
         
         try:
             # Extract configuration from template and workflow
             workflow_type = template.workflow_type
-            template_config = template.config
-            workflow_config = workflow.config
             
             # Merge template and workflow configs, with workflow config taking precedence
-            merged_config = self._merge_configs(template_config, workflow_config)
+            merged_config = self._get_merged_config(template, workflow)
             
             # Create checkpoint directory if needed
             checkpoint_dir = merged_config.get("workflow_config", {}).get("checkpoint_dir", self.checkpoint_dir)
-            os.makedirs(checkpoint_dir, exist_ok=True)
+            ensure_dir(checkpoint_dir)
             
-            # Create LangGraph workflow runner with agentic capabilities
+            # Take an idle LangGraph workflow runner for this template and workflow, or build one
             execution_id = str(uuid.uuid4())
-            workflow_runner = LangGraphWorkflowRunner(template, workflow)
+            runner_key = self._cache_key(template, workflow)
+            workflow_runner = self._acquire_runner(runner_key, template, workflow)
             
             # Execute the workflow using LangGraph
             logger.info(f"Starting agentic workflow execution for {workflow_type}")
             
-            # Execute the workflow
-            result = await workflow_runner.execute(input_data, execution_id=execution_id)
+            # Execute the workflow; a runner that failed is closed rather than reused
+            try:
+                result = await workflow_runner.execute(
+                    input_data, execution_id=execution_id, include_agent_usage=include_agent_usage
+                )
+            except BaseException:
+                await workflow_runner.aclose()
+                raise
+            await self._release_runner(runner_key, workflow_runner)
             
             # Calculate execution time
-            execution_time = (datetime.now() - start_time).total_seconds()
+            execution_time = time.perf_counter() - start_time
             logger.info(f"Workflow execution completed in {execution_time:.2f} seconds")
             
             # Add execution time to the result
@@ -89,7 +123,7 @@ class AgenticWorkflowEngine:
             
         except Exception as e:
             logger.exception(f"Error executing workflow: {str(e)}")
-            execution_time = (datetime.now() - start_time).total_seconds()
+            execution_time = time.perf_counter() - start_time
             
             return {
                 "success": False,
@@ -97,6 +131,52 @@ class AgenticWorkflowEngine:
                 "execution_time": execution_time
             }
 
+    @staticmethod
+    def _cache_key(template: Template, workflow: Workflow) -> Optional[str]:
+        """Key for state derived from a template and workflow while neither row has changed"""
+        # Transient rows without an update time have nothing to key on
+        if template.updated_at is None or workflow.updated_at is None:
+            return None
+        return f"{template.id}:{template.updated_at.isoformat()}:{workflow.id}:{workflow.updated_at.isoformat()}"
+
+    def _acquire_runner(self, key: Optional[str], template: Template, workflow: Workflow) -> LangGraphWorkflowRunner:
+        """Reuse an idle runner (and its compiled graph) for the key, or create a new one"""
+        runners = _idle_runners.get(key) if key is not None else None
+        if runners:
+            return runners.pop()
+        return LangGraphWorkflowRunner(template, workflow)
+
+    async def _release_runner(self, key: Optional[str], runner: LangGraphWorkflowRunner) -> None:
+        """Return a runner to the idle pool, closing it when the pool for its key is full"""
+        if key is None:
+            await runner.aclose()
+            return
+        
+        runners = _idle_runners.setdefault(key, [])
+        _idle_runners.move_to_end(key)
+        if len(runners) < MAX_IDLE_RUNNERS_PER_WORKFLOW:
+            runners.append(runner)
+        else:
+            await runner.aclose()
+        
+        # Drop the least recently used workflows (including ones whose rows have since changed)
+        while len(_idle_runners) > MAX_POOLED_WORKFLOWS:
+            _, evicted = _idle_runners.popitem(last=False)
+            for evicted_runner in evicted:
+                await evicted_runner.aclose()
+
+    def _get_merged_config(self, template: Template, workflow: Workflow) -> Dict[str, Any]:
+        """Merge template and workflow configs, reusing the result while neither row has changed"""
+        key = self._cache_key(template, workflow)
+        if key is None:
+            return self._merge_configs(template.config, workflow.config)
+        
+        merged = merged_config_cache.get(key)
+        if merged is None:
+            merged = self._merge_configs(template.config, workflow.config)
+            merged_config_cache.put(key, merged)
+        return merged
+
     def _merge_configs(self, template_config: Dict[str, Any], workflow_config: Dict[str, Any]) -> Dict[str, Any]:
         """Merge template and workflow configurations, with workflow config taking precedence"""
         merged = template_config.copy()
@@ -154,6 +234,39 @@ class AgenticWorkflowEngine:
             "status": "active"
         }
 
+    @staticmethod
+    def _find_cyclic_agents(execution_graph: Dict[str, List[str]], ignore_target: Optional[str] = None) -> List[str]:
+        """
+        Find agents that sit on a delegation cycle using Kahn's algorithm
+        
+        Args:
+            execution_graph: Mapping of agent name to the agents it may delegate to
+            ignore_target: Agent whose incoming edges are not considered (e.g. the supervisor)
+            
+        Returns:
+            Names of agents left over after the topological sort, i.e. on or behind a cycle
+        """
+        edges = {
+            source: [target for target in targets if target != ignore_target and target != "final"]
+            for source, targets in execution_graph.items()
+        }
+        
+        indegree: Dict[str, int] = {}
+        for source, targets in edges.items():
+            indegree.setdefault(source, 0)
+            for target in targets:
+                indegree[target] = indegree.get(target, 0) + 1
+        
+        queue = deque(agent for agent, degree in indegree.items() if degree == 0)
+        while queue:
+            agent = queue.popleft()
+            for target in edges.get(agent, []):
+                indegree[target] -= 1
+                if indegree[target] == 0:
+                    queue.append(target)
+        
+        return [agent for agent, degree in indegree.items() if degree > 0]
+
     async def validate_workflow(self, workflow_config: Dict[str, Any]) -> Dict[str, Any]:
         """
         Validate a workflow configuration for agentic capabilities
@@ -206,6 +319,15 @@ class AgenticWorkflowEngine:
                             "message": f"Target agent '{target}' in execution graph does not exist"
                         }
             
+            # Workers reporting back to the supervisor is the expected loop; any other
+            # cycle would just bounce between workers until max_iterations is reached
+            cyclic_agents = self._find_cyclic_agents(execution_graph, ignore_target=supervisor.get("name"))
+            if cyclic_agents:
+                return {
+                    "valid": False,
+                    "message": f"Execution graph has a delegation cycle between agents: {', '.join(cyclic_agents)}"
+                }
+            
             # Enhance the configuration with agentic capabilities
             enhanced_config = workflow_config.copy()
             enhanced_config = AgentPromptCreator.enhance_template_with_agentic_capabilities(enhanced_config)
@@ -1,70 +1,355 @@
 # backend/app/engine/langgraph_workflow_runner.py
 import logging
 import asyncio
+import math
 import os
+import time
 import json
+import hashlib
+import operator
+import sys
+from contextlib import nullcontext
 from datetime import datetime
 import uuid
-from typing import Dict, List, Any, Optional, Annotated, TypedDict, cast
+from types import MappingProxyType
+from typing import Dict, List, Any, Optional, Annotated, TypedDict, Union, cast
 
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage, BaseMessage
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.runnables import Runnable, RunnableConfig
 from langgraph.graph import END, StateGraph
+from langgraph.types import Send
 from langgraph.prebuilt import ToolNode
 from langgraph.checkpoint.memory import MemorySaver
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+try:
+    from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+    import aiosqlite
+    SQLITE_CHECKPOINT_AVAILABLE = True
+except ImportError:
+    SQLITE_CHECKPOINT_AVAILABLE = False
+
+# orjson is optional; without it checkpoints use LangGraph's default serializer
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
 
 from app.engine.llm_providers import llm_provider_manager
-from app.engine.agent_decision_parser import AgentDecisionParser, AgentDecision
+from app.engine.agent_decision_parser import AgentDecisionParser, AgentDecision, action_annotations_end
+from app.engine.agent_prompt_creator import AgentPromptCreator
+from app.engine.optimizations import LRUCache, ensure_dir
 from app.db.models import Template, Workflow, WorkflowExecution
 
 logger = logging.getLogger(__name__)
 
+# Delegation targets a supervisor chose for a user query, shared across runs so a repeated
+# query is routed without another LLM call; keyed by _routing_cache_key. Only the parsed
+# decision is kept, never the response text (which may be a final answer)
+routing_cache = LRUCache[List[str]](max_size=512, ttl=3600)
+
+# Agent responses keyed by the full LLM request (model, system message, whitespace-normalized
+# prompt, temperature and tools), so an identical prompt built again in a later iteration or run
+# skips the LLM call; keyed by _response_cache_key
+response_cache = LRUCache[Dict[str, Any]](max_size=1024, ttl=3600)
+
+def _is_plain_json(obj: Any) -> bool:
+    """Whether a value is built only from types that survive a JSON round trip unchanged"""
+    obj_type = type(obj)
+    if obj_type is str or obj_type is bool or obj is None:
+        return True
+    if obj_type is int:
+        return -(1 << 63) <= obj < (1 << 64)
+    if obj_type is float:
+        return math.isfinite(obj)
+    if obj_type is list:
+        return all(_is_plain_json(item) for item in obj)
+    if obj_type is dict:
+        return all(type(key) is str and _is_plain_json(value) for key, value in obj.items())
+    return False
+
+class OrjsonCheckpointSerializer:
+    """
+    Checkpoint serializer that encodes plain JSON state (agents, messages, history) with orjson.
+    
+    Anything else (tuples, bytes, datetimes, non-string keys, LangGraph objects) is delegated
+    to JsonPlusSerializer, so it round-trips unchanged.
+    """
+    
+    def __init__(self):
+        self._fallback = JsonPlusSerializer()
+    
+    def dumps_typed(self, obj: Any) -> tuple:
+        if _is_plain_json(obj):
+            try:
+                return "orjson", orjson.dumps(obj)
+            except Exception:
+                pass
+        return self._fallback.dumps_typed(obj)
+    
+    def loads_typed(self, data: tuple) -> Any:
+        type_, payload = data
+        if type_ == "orjson":
+            return orjson.loads(payload)
+        return self._fallback.loads_typed(data)
+
 # Define state types using TypedDict for better type safety
 class AgentState(TypedDict):
     """Represents the state of an agent in the workflow"""
     messages: List[Dict[str, Any]]     # Messages exchanged with the agent
     next_agent: Optional[str]          # Which agent to route to next
+    next_agents: List[str]             # All delegation targets when fanning out to several agents
     tools_used: List[str]              # Which tools the agent has used
     outputs: Dict[str, Any]            # Results produced by the agent
     metadata: Dict[str, Any]           # Additional metadata
 
+# Number of recent history entries kept in the workflow state; the full history of a run
+# can be appended to a log file in the checkpoint directory. Entry timestamps are epoch
+# microseconds (time.time_ns() // 1000) and are formatted when the result is built
+HISTORY_WINDOW = 256
+
+def _append_history(current: List[Dict[str, Any]], update: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Reducer for WorkflowState.history: appends new entries, keeping the last HISTORY_WINDOW"""
+    merged = current + update
+    return merged[-HISTORY_WINDOW:] if len(merged) > HISTORY_WINDOW else merged
+
+def _format_timestamp(timestamp_us: int) -> str:
+    """Format a history timestamp (epoch microseconds) as a local ISO 8601 string"""
+    seconds, microseconds = divmod(timestamp_us, 1_000_000)
+    return datetime.fromtimestamp(seconds).replace(microsecond=microseconds).isoformat()
+
+def _history_line(entry: Dict[str, Any]) -> bytes:
+    """Encode a history entry as a JSON line for the run's history log (timestamps stay epoch microseconds)"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(entry, default=str) + b"\n"
+    return json.dumps(entry, default=str).encode() + b"\n"
+
+def _new_agent_state(role: str) -> AgentState:
+    """Empty state for an agent at the start of a run"""
+    return {
+        "messages": [],
+        "next_agent": None,
+        "next_agents": [],
+        "tools_used": [],
+        "outputs": {},
+        "metadata": {"role": role}
+    }
+
+# Workflow types the runner can build a graph for
+SUPPORTED_WORKFLOW_TYPES = frozenset({"supervisor", "agentic", "swarm", "rag"})
+
+# Resolved once per process rather than on every runner construction
+CHECKPOINT_DIR = os.environ.get("CHECKPOINT_DIR", "./checkpoints")
+
+# SQLite checkpoint savers by database path, shared by every runner in the process. A saver
+# serializes its own writes, so concurrent runs don't contend for the database file's lock
+_sqlite_checkpointers: Dict[str, Any] = {}
+
+async def close_checkpointers() -> None:
+    """Close the shared checkpoint database connections"""
+    while _sqlite_checkpointers:
+        _, checkpointer = _sqlite_checkpointers.popitem()
+        try:
+            await checkpointer.conn.close()
+        except Exception as e:
+            logger.warning(f"Error closing checkpoint database: {str(e)}")
+
+# LangGraph durability for each checkpoint_mode of the workflow config
+CHECKPOINT_DURABILITY = {
+    "per_step": "async",
+    "per_step_sync": "sync",
+    "end_of_workflow": "exit"
+}
+
+# Agent roles; roles from the template config are interned too, so role checks in the hot
+# path compare the same string objects
+ROLE_SUPERVISOR = sys.intern("supervisor")
+ROLE_WORKER = sys.intern("worker")
+ROLE_AGENT = sys.intern("agent")
+ROLE_RAG = sys.intern("rag")
+
+# Shared read-only stand-in for an agent missing from the state
+_EMPTY_AGENT_STATE = MappingProxyType({})
+
+# AgentState list fields that node updates extend rather than replace
+_APPENDED_AGENT_FIELDS = ("messages", "tools_used")
+
+def _merge_agents(current: Dict[str, AgentState], update: Dict[str, Dict[str, Any]]) -> Dict[str, AgentState]:
+    """
+    Reducer for WorkflowState.agents: nodes return only the agents and fields they changed.
+    
+    An update's "messages" and "tools_used" are new entries appended to the agent's lists, so
+    agents running in parallel can all message the same agent (e.g. workers reporting to the
+    supervisor).
+    """
+    merged = dict(current)
+    for name, fields in update.items():
+        previous = current.get(name, _EMPTY_AGENT_STATE)
+        agent = {**previous, **fields}
+        for key in _APPENDED_AGENT_FIELDS:
+            if key in fields:
+                agent[key] = previous.get(key, []) + fields[key]
+        merged[name] = agent
+    return merged
+
+def _latest(current: Any, update: Any) -> Any:
+    """Reducer keeping the last value written when several parallel branches write a channel"""
+    return update
+
+def _merge_execution_graph(current: Dict[str, List[str]], update: Dict[str, List[str]]) -> Dict[str, List[str]]:
+    """Reducer for WorkflowState.execution_graph: adds new edges without duplicating existing ones"""
+    merged = dict(current)
+    for source, targets in update.items():
+        edges = merged.get(source, [])
+        new_edges = [target for target in targets if target not in edges]
+        if new_edges:
+            merged[source] = edges + new_edges
+    return merged
+
 class WorkflowState(TypedDict):
     """Overall workflow state containing all agent states and global info"""
-    agents: Dict[str, AgentState]      # States for all agents
+    agents: Annotated[Dict[str, AgentState], _merge_agents]  # States for all agents (merged per agent and field)
     input: Dict[str, Any]              # Initial input to the workflow
-    current_agent: str                 # Current active agent
-    history: List[Dict[str, Any]]      # History of agent activations
+    current_agent: Annotated[str, _latest]  # Current active agent (last writer among parallel branches)
+    history: Annotated[List[Dict[str, Any]], _append_history]  # Recent agent activations (nodes return new entries only)
     final_output: Optional[Any]        # Final output of the workflow
-    execution_graph: Dict[str, List[str]]  # Dynamic execution graph
-    iteration: int                     # Current iteration count
+    execution_graph: Annotated[Dict[str, List[str]], _merge_execution_graph]  # Dynamic execution graph
+    iteration: Annotated[int, _latest]  # Current iteration count (parallel branches write the same value)
     metadata: Dict[str, Any]           # Additional workflow metadata
-    decisions: List[Dict[str, Any]]    # List of agent decisions taken
+    decisions: Annotated[List[Dict[str, Any]], operator.add]  # List of agent decisions taken (appended per node)
 
 class LangGraphWorkflowRunner:
     """
     Runner for agentic workflows using LangGraph for dynamic agent routing
     """
     
+    __slots__ = (
+        "template", "workflow", "llm_provider", "execution_id", "checkpoint_dir", "decision_parser",
+        "workflow_type", "workflow_config", "interaction_type", "hub_agent",
+        "_tool_call_cache", "available_tools", "max_iterations", "execution_graph", "_allowed_targets", "_enforce_graph",
+        "agent_configs", "_agent_names", "entry_agent", "_default_next", "_final_output_fn", "_agent_prompt_templates",
+        "_parser_context_static", "_workers", "_run_outputs", "_agent_model_index", "_agent_providers", "_template_id",
+        "routing_cache_enabled", "response_cache_enabled", "stream_routing_enabled", "_parallel_fan_out", "max_concurrent_agents",
+        "checkpointer", "checkpoint_durability", "history_log_enabled", "_graph_builder", "_compiled_graph"
+    )
+    
     def __init__(self, template: Template, workflow: Workflow):
         self.template = template
         self.workflow = workflow
         self.llm_provider = llm_provider_manager
         self.execution_id = None
-        self.checkpoint_dir = os.environ.get("CHECKPOINT_DIR", "./checkpoints")
+        self.checkpoint_dir = CHECKPOINT_DIR
         self.decision_parser = AgentDecisionParser()
         
         # Get workflow type and initialize the appropriate graph
         self.workflow_type = template.workflow_type
+        if self.workflow_type not in SUPPORTED_WORKFLOW_TYPES:
+            raise ValueError(f"Unsupported workflow type: {self.workflow_type}")
         
-        # Load available tools
+        # Workflow settings read while routing, resolved once from the template and read-only
+        # afterwards so nothing cached from them goes stale
+        self.workflow_config = MappingProxyType(dict(self.template.config.get("workflow_config") or {}))
+        self.interaction_type = self.workflow_config.get("interaction_type", "sequential")
+        self.hub_agent = self.workflow_config.get("hub_agent")
+        
+        # Load available tools; identical calls within an execution share one in-flight result
+        self._tool_call_cache: Dict[tuple, asyncio.Future] = {}
         self.available_tools = self._load_available_tools()
         
         # Set a reasonable default for max iterations
-        self.max_iterations = self.workflow.config.get("workflow_config", {}).get("max_iterations", 5)
+        self.max_iterations = self.workflow_config.get("max_iterations", 5)
+        
+        # Normalize the declared execution graph once: ordered targets for fallback
+        # routing and frozensets for the routing step's membership checks
+        self.execution_graph = {
+            source: list(targets)
+            for source, targets in (self.workflow.config.get("execution_graph") or {}).items()
+        }
+        self._allowed_targets = {source: frozenset(targets) for source, targets in self.execution_graph.items()}
+        self._enforce_graph = bool(self.workflow.config.get("override_agent_decisions", False) and self.execution_graph)
+        
+        # Agents, the entry agent and the workflow-type specific behaviour are fixed for the
+        # runner, so they are resolved once instead of branching on the workflow type per call
+        self.agent_configs = tuple(self._agent_configs())
+        self._agent_names = {agent_config["name"]: agent_config["name"] for agent_config in self.agent_configs}
+        self.entry_agent = self._entry_agent_name()
+        self._default_next = self._default_routes()
+        self._final_output_fn = self._final_output_strategy()
+        
+        # Prompt templates and the dynamic placeholders each one uses, resolved once per agent
+        self._agent_prompt_templates = {
+            agent_config["name"]: self._resolve_prompt_template(agent_config)
+            for agent_config in self.agent_configs
+        }
+        
+        # Decision parser context; agents, roles and tools are fixed for the runner, only the
+        # iteration changes per turn
+        agent_roles = {agent_config["name"]: agent_config["role"] for agent_config in self.agent_configs}
+        self._parser_context_static = {
+            "workflow_type": self.workflow_type,
+            "available_agents": list(agent_roles),
+            "agent_roles": agent_roles,
+            "workers": [name for name, role in agent_roles.items() if role == ROLE_WORKER],
+            "hub_agent": self.hub_agent,
+            "tools_available": list(self.available_tools.keys())
+        }
+        
+        # "name: output" lines for the worker_outputs/previous_outputs placeholders, kept per
+        # execution and updated as each agent responds, plus the joined text per placeholder and
+        # agent until the next output arrives
+        self._workers = frozenset(self._parser_context_static["workers"])
+        self._run_outputs: Dict[str, Dict[str, Dict[Any, str]]] = {}
         
-        # Create the checkpoint directory
-        os.makedirs(self.checkpoint_dir, exist_ok=True)
+        # Provider per agent, for warming connections ahead of its turn
+        self._agent_providers = {
+            agent_config["name"]: agent_config.get("model_provider", "vertex_ai")
+            for agent_config in self.agent_configs
+        }
+        
+        # "provider/model" per agent for the usage summary of each result
+        self._agent_model_index = {
+            agent_config["name"]: f"{agent_config.get('model_provider', 'vertex_ai')}/{agent_config.get('model_name', 'gemini-1.5-pro')}"
+            for agent_config in self.agent_configs
+        }
+        
+        # Reuse supervisor routing decisions for repeated queries when enabled; keys include
+        # the template id, read once so executions don't touch the template row
+        self._template_id = str(getattr(self.template, "id", ""))
+        self.routing_cache_enabled = self.template.config.get("routing_cache", {}).get("enabled", False)
+        
+        # Replaying identical LLM requests changes sampled outputs, so it is opt-in
+        self.response_cache_enabled = self.template.config.get("response_cache", {}).get("enabled", False)
+        
+        # Optionally stream the entry agent's responses and route as soon as its action
+        # annotations are complete; any text after them is not waited for
+        self.stream_routing_enabled = self.template.config.get("stream_routing", {}).get("enabled", False)
+        
+        # Whether delegations to several agents fan out to them in parallel (supervisor, hub and spoke)
+        self._parallel_fan_out = (
+            self.workflow_type in ("supervisor", "agentic")
+            or (self.workflow_type == "swarm" and self.interaction_type == "hub_and_spoke")
+        )
+        
+        # Upper bound on agent nodes running at once in a fan-out super-step
+        self.max_concurrent_agents = max(1, int(self.template.config.get("max_concurrent_agents", 8)))
+        
+        # Checkpointer, resolved on first execution (the SQLite saver needs a running event loop).
+        # With checkpoint_mode "end_of_workflow" the state is persisted once when the run ends
+        # instead of after every super-step, for workflows that don't need mid-run recovery
+        self.checkpointer = None
+        checkpoint_mode = self.workflow.config.get("checkpoint_mode", "per_step")
+        self.checkpoint_durability = CHECKPOINT_DURABILITY.get(checkpoint_mode, "async")
+        
+        # With history_log enabled, each run's full history is appended to a JSON lines file in
+        # the checkpoint directory; nothing rotates these files, so it is opt-in
+        self.history_log_enabled = bool(self.workflow.config.get("history_log", False))
+        
+        # Template and workflow are fixed for the runner, so the graph is built once and
+        # compiled on the first execution (with the checkpointer), then reused across runs
+        self._graph_builder = self._create_graph(self.template.config)
+        self._compiled_graph = None
     
     def _load_available_tools(self) -> Dict[str, Any]:
         """Load available tools from the template configuration"""
@@ -96,70 +381,153 @@ class LangGraphWorkflowRunner:
         return tools
     
     def _get_placeholder_tool_function(self, tool_name: str):
-        """Get a placeholder function for a tool"""
-        async def tool_function(**kwargs):
+        """Get a placeholder function for a tool, coalescing identical calls within an execution"""
+        async def call_tool(**kwargs):
             # In a real implementation, this would call the actual tool
             return f"Result from {tool_name} with params: {kwargs}"
         
+        async def tool_function(**kwargs):
+            try:
+                key = (tool_name, tuple(sorted(kwargs.items())))
+                future = self._tool_call_cache.get(key)
+            except TypeError:
+                # Unhashable parameters are not coalesced
+                return await call_tool(**kwargs)
+            
+            if future is None:
+                future = asyncio.ensure_future(call_tool(**kwargs))
+                self._tool_call_cache[key] = future
+            
+            try:
+                return await asyncio.shield(future)
+            except Exception:
+                # Failed calls are retried by the next caller
+                if self._tool_call_cache.get(key) is future:
+                    del self._tool_call_cache[key]
+                raise
+        
         return tool_function
     
-    async def execute(self, input_data: Dict[str, Any], execution_id: Optional[str] = None) -> Dict[str, Any]:
+    async def execute(
+        self,
+        input_data: Dict[str, Any],
+        execution_id: Optional[str] = None,
+        include_agent_usage: bool = True
+    ) -> Dict[str, Any]:
         """
         Execute the workflow with the given input data
         
         Args:
             input_data: Input data for the workflow (e.g. {"query": "What is..."})
             execution_id: Optional ID for the execution (for tracking)
+            include_agent_usage: Whether to add the per-agent usage summary to the result
             
         Returns:
             The final workflow state and results
         """
         self.execution_id = execution_id or str(uuid.uuid4())
+        self._tool_call_cache.clear()
+        self._run_outputs[self.execution_id] = {"previous_outputs": {}, "worker_outputs": {}, "joined": {}}
         
         try:
             logger.info(f"Starting workflow execution {self.execution_id}")
             
-            # Get configuration values
-            config = self.template.config
-            self.max_iterations = config.get("workflow_config", {}).get("max_iterations", 5)
-            
-            # Create the LangGraph based on workflow type
-            if self.workflow_type == "supervisor" or self.workflow_type == "agentic":
-                graph = self._create_supervisor_graph(config)
-            elif self.workflow_type == "swarm":
-                graph = self._create_swarm_graph(config)
-            elif self.workflow_type == "rag":
-                graph = self._create_rag_graph(config)
-            else:
-                raise ValueError(f"Unsupported workflow type: {self.workflow_type}")
-            
             # Create initial state
             initial_state = self._create_initial_state(input_data)
             
-            # Create memory saver for checkpointing
-            memory_saver = MemorySaver()
+            # The checkpoint directory is created on the first run that writes to it
+            ensure_dir(self.checkpoint_dir)
+            
+            # Checkpoint each super-step under this execution's thread
+            checkpointer = self._get_checkpointer()
+            if self._compiled_graph is None or checkpointer is not self.checkpointer:
+                self.checkpointer = checkpointer
+                self._compiled_graph = self._graph_builder.compile(checkpointer=checkpointer)
             
             # Execute the workflow
             logger.info(f"Executing {self.workflow_type} workflow with LangGraph")
             
             # Set up config for the run
-            config = {"configurable": {"thread_id": self.execution_id}}
+            config = {"configurable": {"thread_id": self.execution_id}, "max_concurrency": self.max_concurrent_agents}
             
-            # Run the workflow
-            final_state = await graph.ainvoke(
-                initial_state, 
-                config=config,
-                saver=memory_saver
-            )
+            # Run the workflow; with the history log enabled, each node's history entries are
+            # streamed to the run's log since the state only keeps the most recent ones
+            final_state = None
+            if self.history_log_enabled:
+                history_path = os.path.join(self.checkpoint_dir, f"{self.execution_id}.history.jsonl")
+                history_log_file = open(history_path, "ab", buffering=1 << 16)
+            else:
+                history_log_file = nullcontext()
+            with history_log_file as history_log:
+                async for mode, chunk in self._compiled_graph.astream(
+                    initial_state,
+                    config=config,
+                    stream_mode=["updates", "values"] if history_log is not None else ["values"],
+                    durability=self.checkpoint_durability
+                ):
+                    if mode == "values":
+                        final_state = chunk
+                        continue
+                    for update in chunk.values():
+                        if isinstance(update, dict):
+                            for entry in update.get("history", ()):
+                                history_log.write(_history_line(entry))
             
             # Process final state to get the result
-            result = self._process_final_state(final_state)
+            result = self._process_final_state(final_state, include_agent_usage)
             
             return result
             
         except Exception as e:
             logger.exception(f"Error executing workflow: {str(e)}")
             raise
+        
+        finally:
+            self._run_outputs.pop(self.execution_id, None)
+            # Checkpoints only serve the run itself, so the thread's are removed once it ends
+            if self.checkpointer is not None:
+                try:
+                    await self.checkpointer.adelete_thread(self.execution_id)
+                except Exception as e:
+                    logger.warning(f"Error deleting checkpoints of execution {self.execution_id}: {str(e)}")
+    
+    def _get_checkpointer(self):
+        """
+        Return the checkpointer for the runner's checkpoint directory.
+        
+        Checkpoints are written to a SQLite database in the checkpoint directory when
+        langgraph-checkpoint-sqlite is installed, through one saver per database shared by
+        all runners of the process; otherwise the runner keeps an in-memory saver.
+        """
+        serde = OrjsonCheckpointSerializer() if ORJSON_AVAILABLE else None
+        if not SQLITE_CHECKPOINT_AVAILABLE:
+            return self.checkpointer or MemorySaver(serde=serde)
+        
+        db_path = os.path.join(self.checkpoint_dir, "langgraph_checkpoints.sqlite")
+        checkpointer = _sqlite_checkpointers.get(db_path)
+        # A saver is bound to the event loop it was opened on
+        if checkpointer is None or checkpointer.loop is not asyncio.get_running_loop():
+            if checkpointer is not None and checkpointer.loop.is_closed():
+                checkpointer.conn.stop()
+            checkpointer = AsyncSqliteSaver(aiosqlite.connect(db_path), serde=serde)
+            _sqlite_checkpointers[db_path] = checkpointer
+        return checkpointer
+    
+    async def aclose(self) -> None:
+        """Release the runner's compiled graph; shared checkpoint connections stay open until close_checkpointers"""
+        self.checkpointer = None
+        self._compiled_graph = None
+    
+    def _create_graph(self, config: Dict[str, Any]) -> StateGraph:
+        """Create the LangGraph for the template's workflow type"""
+        if self.workflow_type == "supervisor" or self.workflow_type == "agentic":
+            return self._create_supervisor_graph(config)
+        elif self.workflow_type == "swarm":
+            return self._create_swarm_graph(config)
+        elif self.workflow_type == "rag":
+            return self._create_rag_graph(config)
+        else:
+            raise ValueError(f"Unsupported workflow type: {self.workflow_type}")
     
     def _create_supervisor_graph(self, config: Dict[str, Any]) -> StateGraph:
         """Create a LangGraph for supervisor workflow"""
@@ -178,36 +546,23 @@ class LangGraphWorkflowRunner:
             if worker_name:
                 workflow_graph.add_node(worker_name, self._create_agent_node(worker_config))
         
-        # Add router node for decision routing
-        workflow_graph.add_node("router", self._create_router_node())
-        
         # Add final output node
         workflow_graph.add_node("final", self._create_final_node())
         
-        # Add conditional edges based on agent decisions
-        workflow_graph.add_edge(supervisor_name, "router")
+        # The supervisor receives the user query first
+        workflow_graph.set_entry_point(supervisor_name)
         
-        # Router decides where to go next
-        workflow_graph.add_conditional_edges(
-            "router",
-            self._get_next_agent,
-            {
-                "final": "final",
-                **{worker.get("name"): worker.get("name") for worker in config.get("workers", [])}
-            }
+        # Each agent's decision picks the next node; workers report back to the supervisor
+        self._add_agent_routes(
+            workflow_graph,
+            [supervisor_name] + [worker.get("name") for worker in config.get("workers", []) if worker.get("name")]
         )
         
-        # Workers report back to supervisor
-        for worker_config in config.get("workers", []):
-            worker_name = worker_config.get("name")
-            if worker_name:
-                workflow_graph.add_edge(worker_name, "router")
-        
         # Final node
         workflow_graph.add_edge("final", END)
         
-        # Compile and return the graph
-        return workflow_graph.compile()
+        # Return the graph; it is compiled with the checkpointer on first execution
+        return workflow_graph
     
     def _create_swarm_graph(self, config: Dict[str, Any]) -> StateGraph:
         """Create a LangGraph for swarm workflow"""
@@ -220,64 +575,25 @@ class LangGraphWorkflowRunner:
             if agent_name:
                 workflow_graph.add_node(agent_name, self._create_agent_node(agent_config))
         
-        # Add router node for decision routing
-        workflow_graph.add_node("router", self._create_router_node())
-        
         # Add final output node
         workflow_graph.add_node("final", self._create_final_node())
         
-        # Get interaction type
-        interaction_type = config.get("workflow_config", {}).get("interaction_type", "sequential")
+        # The first agent (or the hub) receives the user query
+        workflow_graph.set_entry_point(self.entry_agent)
         
-        if interaction_type == "sequential":
-            # In sequential mode, each agent goes to router
-            for agent_config in config.get("agents", []):
-                agent_name = agent_config.get("name")
-                if agent_name:
-                    workflow_graph.add_edge(agent_name, "router")
-            
-            # Router decides next agent
-            workflow_graph.add_conditional_edges(
-                "router",
-                self._get_next_agent,
-                {
-                    "final": "final",
-                    **{agent.get("name"): agent.get("name") for agent in config.get("agents", [])}
-                }
-            )
-            
-        elif interaction_type == "hub_and_spoke":
-            # Hub and spoke mode
-            hub_agent = config.get("workflow_config", {}).get("hub_agent")
-            
-            if not hub_agent and config.get("agents"):
-                # Default to first agent as hub if not specified
-                hub_agent = config.get("agents")[0].get("name")
-            
-            # Hub routes through router
-            workflow_graph.add_edge(hub_agent, "router")
-            
-            # Spokes route back to hub
-            for agent_config in config.get("agents", []):
-                agent_name = agent_config.get("name")
-                if agent_name and agent_name != hub_agent:
-                    workflow_graph.add_edge(agent_name, "router")
-            
-            # Router decides next agent
-            workflow_graph.add_conditional_edges(
-                "router",
-                self._get_next_agent,
-                {
-                    "final": "final",
-                    **{agent.get("name"): agent.get("name") for agent in config.get("agents", [])}
-                }
+        # Each agent's decision picks the next node: the next agent in sequential mode, or the
+        # hub fanning out to several spokes and the spokes reporting back in hub-and-spoke mode
+        if self.interaction_type in ("sequential", "hub_and_spoke"):
+            self._add_agent_routes(
+                workflow_graph,
+                [agent.get("name") for agent in config.get("agents", []) if agent.get("name")]
             )
         
         # Final node
         workflow_graph.add_edge("final", END)
         
-        # Compile and return the graph
-        return workflow_graph.compile()
+        # Return the graph; it is compiled with the checkpointer on first execution
+        return workflow_graph
     
     def _create_rag_graph(self, config: Dict[str, Any]) -> StateGraph:
         """Create a LangGraph for RAG workflow"""
@@ -285,303 +601,702 @@ class LangGraphWorkflowRunner:
         workflow_graph = StateGraph(WorkflowState)
         
         # For RAG workflow, create a single agent node
-        agent_name = "rag_agent"
-        rag_config = {
-            "name": agent_name,
-            "role": "rag",
-            "model_provider": config.get("model_provider", "vertex_ai"),
-            "model_name": config.get("model_name", "gemini-1.5-pro"),
-            "system_message": config.get("system_message", ""),
-            "tools": ["retrieve_information"]
-        }
+        rag_config = self._rag_agent_config(config)
+        agent_name = rag_config["name"]
         
         workflow_graph.add_node(agent_name, self._create_agent_node(rag_config))
-        
-        # Add router node
-        workflow_graph.add_node("router", self._create_router_node())
+        workflow_graph.set_entry_point(agent_name)
         
         # Add final output node
         workflow_graph.add_node("final", self._create_final_node())
         
-        # Add edges
-        workflow_graph.add_edge(agent_name, "router")
-        
-        # Router decides next step
-        workflow_graph.add_conditional_edges(
-            "router",
-            self._get_next_agent,
-            {
-                "final": "final",
-                agent_name: agent_name
-            }
-        )
+        # The agent's decision picks the next step
+        self._add_agent_routes(workflow_graph, [agent_name])
         
         # Final node
         workflow_graph.add_edge("final", END)
         
-        # Compile and return the graph
-        return workflow_graph.compile()
+        # Return the graph; it is compiled with the checkpointer on first execution
+        return workflow_graph
+    
+    def _add_agent_routes(self, workflow_graph: StateGraph, agent_names: List[str]) -> None:
+        """Route each agent node straight to the next agent(s) or the final node"""
+        route_map = {"final": "final", **{name: name for name in agent_names}}
+        for agent_name in agent_names:
+            workflow_graph.add_conditional_edges(agent_name, self._get_next_agent, route_map)
+    
+    def _rag_agent_config(self, config: Dict[str, Any]) -> Dict[str, Any]:
+        """Agent configuration for the single agent of a RAG workflow"""
+        return {
+            "name": "rag_agent",
+            "role": ROLE_RAG,
+            "model_provider": config.get("model_provider", "vertex_ai"),
+            "model_name": config.get("model_name", "gemini-1.5-pro"),
+            "system_message": config.get("system_message", ""),
+            "prompt_template": config.get("prompt_template", ""),
+            "tools": ["retrieve_information"]
+        }
+    
+    def _agent_configs(self) -> List[Dict[str, Any]]:
+        """All named agent configurations of the workflow, with their default roles filled in"""
+        config = self.template.config
+        
+        if self.workflow_type == "supervisor" or self.workflow_type == "agentic":
+            supervisor = config.get("supervisor", {})
+            agent_configs = [{"name": "supervisor", **supervisor, "role": ROLE_SUPERVISOR}]
+            agent_configs.extend({"role": ROLE_WORKER, **worker} for worker in config.get("workers", []) if worker.get("name"))
+        elif self.workflow_type == "swarm":
+            agent_configs = [{"role": ROLE_AGENT, **agent} for agent in config.get("agents", []) if agent.get("name")]
+        elif self.workflow_type == "rag":
+            agent_configs = [self._rag_agent_config(config)]
+        else:
+            agent_configs = []
+        
+        # Names and roles key the state and are compared on every turn, so they are interned
+        for agent_config in agent_configs:
+            agent_config["name"] = sys.intern(agent_config["name"])
+            agent_config["role"] = sys.intern(agent_config["role"])
+        return agent_configs
+    
+    def _entry_agent_name(self) -> Optional[str]:
+        """Name of the agent that receives the user query"""
+        if self.workflow_type == "swarm" and self.interaction_type == "hub_and_spoke" and self.hub_agent:
+            return self.hub_agent
+        
+        agent_configs = self.agent_configs
+        return agent_configs[0]["name"] if agent_configs else None
     
     def _create_agent_node(self, agent_config: Dict[str, Any]):
         """Create a function for processing an agent node in the graph"""
-        agent_name = agent_config.get("name", "agent")
+        agent_name = sys.intern(agent_config.get("name", "agent"))
+        
+        # Routing turns (a supervisor handling the user's query) can reuse an earlier response
+        agent_role = self._parser_context_static["agent_roles"].get(agent_name)
+        cache_routing = self.routing_cache_enabled and agent_role is ROLE_SUPERVISOR
+        
+        # Agent configuration and tool definitions are fixed for the node
+        model_provider = agent_config.get("model_provider", "vertex_ai")
+        model_name = agent_config.get("model_name", "gemini-1.5-pro")
+        system_message = agent_config.get("system_message", "")
+        temperature = agent_config.get("temperature", 0.7)
+        tools = [
+            self.available_tools[tool_name]["definition"]
+            for tool_name in agent_config.get("tools", [])
+            if tool_name in self.available_tools
+        ]
+        stream_routing = not tools and self.stream_routing_enabled and agent_name == self.entry_agent
         
-        async def agent_function(state: WorkflowState) -> WorkflowState:
+        # The system message is identical on every turn, so it is marked as a provider
+        # prompt-cache prefix; the per-turn state only appears in the prompt after it
+        cache_prefix = bool(system_message)
+        
+        async def agent_function(state: WorkflowState) -> Dict[str, Any]:
+            # The routing step runs in the same super-step as the agent, right before its
+            # outgoing conditional edge picks the next node
+            return self._route_agent(state, agent_name, await run_agent(state))
+        
+        async def run_agent(state: WorkflowState) -> Dict[str, Any]:
             # Get agent state
-            agent_state = state["agents"].get(agent_name, {})
+            agent_state = state["agents"][agent_name]
             
             # Skip if no messages to process
-            if not agent_state.get("messages"):
-                return state
+            messages = agent_state["messages"]
+            if not messages:
+                return {}
             
-            # Get agent configuration
-            model_provider = agent_config.get("model_provider", "vertex_ai")
-            model_name = agent_config.get("model_name", "gemini-1.5-pro")
-            system_message = agent_config.get("system_message", "")
-            prompt_template = agent_config.get("prompt_template", "")
-            temperature = agent_config.get("temperature", 0.7)
-            
-            # Build the prompt
-            prompt = self._build_agent_prompt(
-                prompt_template=prompt_template,
-                agent_state=agent_state,
-                state=state,
-                agent_config=agent_config
-            )
+            # Messages only grow, so if the agent's own reply is still the latest one nothing new
+            # was routed to it since its last turn; keep its previous output and decision
+            if messages[-1]["role"] == "assistant" and agent_state["outputs"].get("final"):
+                logger.info(f"No new messages for agent {agent_name}, reusing its previous output")
+                return {"current_agent": agent_name}
             
-            # Get tool definitions if agent has tools
-            tools = []
-            if agent_config.get("tools"):
-                for tool_name in agent_config.get("tools", []):
-                    if tool_name in self.available_tools:
-                        tools.append(self.available_tools[tool_name]["definition"])
-            
-            # Generate the agent's response
-            logger.info(f"Generating response for agent {agent_name}")
+            # Any failure (prompt, tools or LLM call) is recorded as this agent's error, so a
+            # failing branch of a parallel fan-out doesn't abort its siblings
             try:
-                response = await self.llm_provider.generate_response(
-                    provider_name=model_provider,
-                    model_name=model_name,
-                    prompt=prompt,
-                    system_message=system_message,
-                    temperature=temperature,
-                    tools=tools
+                # Routing turns can reuse an earlier delegation decision
+                cache_key = None
+                if cache_routing and messages[-1].get("from", "user") == "user":
+                    cache_key = self._routing_cache_key(agent_name, agent_config, messages, state)
+                    cached_targets = routing_cache.get(cache_key)
+                    if cached_targets is not None:
+                        logger.info(f"Using cached routing decision for agent {agent_name}")
+                        content = " ".join(f"[ACTION: delegate to {target}]" for target in cached_targets)
+                        return self._process_agent_response(state, agent_name, {"content": content})
+                
+                # Build the prompt
+                prompt = await self._build_agent_prompt(
+                    agent_state=agent_state,
+                    state=state,
+                    agent_config=agent_config
                 )
                 
+                # Identical LLM requests reuse an earlier response
+                response_key = None
+                response = None
+                if self.response_cache_enabled:
+                    response_key = self._response_cache_key(model_provider, model_name, system_message, prompt, temperature, tools)
+                    response = response_cache.get(response_key)
+                    if response is not None:
+                        logger.info(f"Using cached response for agent {agent_name}")
+                
+                # Generate the agent's response
+                if response is None:
+                    logger.info(f"Generating response for agent {agent_name}")
+                    request = dict(
+                        provider_name=model_provider,
+                        model_name=model_name,
+                        prompt=prompt,
+                        system_message=system_message,
+                        temperature=temperature,
+                        tools=tools,
+                        cache_prefix=cache_prefix
+                    )
+                    if stream_routing:
+                        response = await self._stream_routing_response(request)
+                    else:
+                        response = await self.llm_provider.generate_response(**request)
+                    # Provider failures come back as error responses and are never cached
+                    if response_key is not None and response.get("content") and "error" not in response:
+                        response_cache.put(response_key, response)
+                
                 # Process the response to get next agent
-                return self._process_agent_response(state, agent_name, response)
+                update = self._process_agent_response(state, agent_name, response)
+                
+                # Only delegations are cached for routing, as their target list
+                if cache_key is not None and "error" not in response and update["decisions"][0]["action_type"] == "delegate":
+                    targets = update["agents"][agent_name]["next_agents"]
+                    if targets:
+                        routing_cache.put(cache_key, list(targets))
+                
+                return update
                 
             except Exception as e:
                 logger.error(f"Error generating response for agent {agent_name}: {str(e)}")
                 
                 # Update state with error
-                new_state = dict(state)
-                new_state["agents"] = dict(state["agents"])
-                new_state["agents"][agent_name] = dict(state["agents"].get(agent_name, {}))
-                new_state["agents"][agent_name]["outputs"] = {
-                    "error": str(e),
-                    "final": f"Error: {str(e)}"
+                self._record_output(state, agent_name, f"Error: {str(e)}")
+                agent_update = {
+                    "outputs": {
+                        "error": str(e),
+                        "final": f"Error: {str(e)}"
+                    },
+                    "next_agent": "final",
+                    "next_agents": []
                 }
+                agents = {agent_name: agent_update}
+                
+                # The error goes back to the agent that delegated the work so it can decide what
+                # to do next; without a delegating agent the workflow ends
+                delegator = messages[-1].get("from")
+                if delegator in state["agents"] and delegator != agent_name:
+                    agent_update["next_agent"] = delegator
+                    agent_update["next_agents"] = [delegator]
+                    agents[delegator] = {"messages": [{
+                        "role": "user",
+                        "content": f"Error from {agent_name}: {str(e)}",
+                        "from": agent_name
+                    }]}
                 
                 # Add to history
                 history_entry = {
-                    "timestamp": datetime.now().isoformat(),
+                    "timestamp": time.time_ns() // 1000,
                     "agent": agent_name,
                     "action": "error",
                     "error": str(e)
                 }
-                new_state["history"] = state.get("history", []) + [history_entry]
                 
-                return new_state
+                return {"agents": agents, "current_agent": agent_name, "history": [history_entry]}
         
         return agent_function
     
-    def _create_router_node(self):
-        """Create the router node function for the graph"""
-        
-        def router_function(state: WorkflowState) -> WorkflowState:
-            # Get current agent
-            current_agent = state.get("current_agent")
-            if not current_agent:
-                # Default to first agent if none specified
-                agents = list(state.get("agents", {}).keys())
-                if agents:
-                    current_agent = agents[0]
-                else:
-                    # No agents, route to final
-                    new_state = dict(state)
-                    agent_state = new_state["agents"].get(current_agent, {})
-                    agent_state["next_agent"] = "final"
-                    return new_state
-            
-            # Get agent state
-            agent_state = state["agents"].get(current_agent, {})
-            
-            # Get routing decision (next agent)
-            next_agent = agent_state.get("next_agent")
-            
-            # Update iteration count
-            new_state = dict(state)
-            new_state["iteration"] = state.get("iteration", 0) + 1
+    def _routing_cache_key(
+        self,
+        agent_name: str,
+        agent_config: Dict[str, Any],
+        messages: List[Dict[str, Any]],
+        state: WorkflowState
+    ) -> str:
+        """
+        Cache key for a routing turn: template, agent, the agent's full configuration (model,
+        prompts, temperature, tools), latest user message and available agents
+        """
+        key_data = json.dumps([
+            self._template_id,
+            agent_name,
+            agent_config,
+            messages[-1].get("content", ""),
+            sorted(state["agents"].keys())
+        ], sort_keys=True, default=str)
+        return hashlib.sha256(key_data.encode()).hexdigest()
+    
+    async def _stream_routing_response(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Stream a response, stopping once its [ACTION: ...] annotations are complete"""
+        parts = []
+        stream = self.llm_provider.astream_response(**request)
+        try:
+            async for chunk in stream:
+                parts.append(chunk)
+                if "\n" not in chunk:
+                    continue
+                content = "".join(parts)
+                cut = action_annotations_end(content)
+                if cut is not None:
+                    logger.info("Routing decision complete, stopping the response stream")
+                    parts = [content[:cut]]
+                    break
+        finally:
+            await stream.aclose()
+        
+        return {
+            "content": "".join(parts),
+            "model": f"{request['provider_name']}/{request['model_name']}"
+        }
+    
+    @staticmethod
+    def _response_cache_key(
+        model_provider: str,
+        model_name: str,
+        system_message: str,
+        prompt: str,
+        temperature: float,
+        tools: List[Dict[str, Any]]
+    ) -> str:
+        """Cache key for an LLM request; runs of whitespace in the prompt are treated as equal"""
+        key_data = json.dumps([
+            model_provider,
+            model_name,
+            system_message,
+            " ".join(prompt.split()),
+            temperature,
+            [tool.get("name") for tool in tools]
+        ])
+        return hashlib.blake2b(key_data.encode(), digest_size=16).hexdigest()
+    
+    def _route_agent(self, state: WorkflowState, agent_name: str, update: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Routing step fused into each agent node: counts the iteration, enforces max_iterations
+        and the execution graph on the agent's decision, and records the route
+        """
+        agent_state = state["agents"][agent_name]
+        agent_update = update.get("agents", {}).get(agent_name, {})
+        next_agent = agent_update.get("next_agent", agent_state["next_agent"])
+        
+        # Update iteration count; each branch fills in the single history entry
+        iteration = state.get("iteration", 0) + 1
+        correction = None
+        history_entry = {
+            "timestamp": time.time_ns() // 1000,
+            "agent": agent_name,
+            "action": "route",
+            "next": next_agent
+        }
+        
+        # Check if we've reached max iterations
+        if iteration > self.max_iterations:
+            logger.info(f"Reached max iterations ({self.max_iterations}), forcing to final")
             
-            # Check if we've reached max iterations
-            if new_state["iteration"] > self.max_iterations:
-                logger.info(f"Reached max iterations ({self.max_iterations}), forcing to final")
-                
-                # Force next agent to final
-                agents = new_state["agents"]
-                agents[current_agent] = dict(agents[current_agent])
-                agents[current_agent]["next_agent"] = "final"
-                
-                # Add to history
-                history_entry = {
-                    "timestamp": datetime.now().isoformat(),
-                    "agent": current_agent,
-                    "action": "max_iterations_reached",
-                    "next": "final"
-                }
-                new_state["history"] = state.get("history", []) + [history_entry]
-                
-                return new_state
+            # Force next agent to final
+            correction = {"next_agent": "final", "next_agents": []}
+            history_entry["action"] = "max_iterations_reached"
+            history_entry["next"] = "final"
+        
+        # Check execution graph constraints if enabled
+        elif self._enforce_graph and agent_name in self._allowed_targets:
+            allowed = self._allowed_targets[agent_name]
+            allowed_targets = self.execution_graph[agent_name]
             
-            # Check execution graph constraints if enabled
-            if self.workflow.config.get("override_agent_decisions", False) and self.workflow.config.get("execution_graph"):
-                execution_graph = self.workflow.config.get("execution_graph", {})
+            # If the next agent is not in the allowed targets, choose the first one
+            if next_agent != "final" and next_agent not in allowed and allowed_targets:
+                logger.warning(f"Agent {agent_name} tried to delegate to {next_agent} but it's not allowed by execution graph")
                 
-                # If current agent is in the graph and next agent is not in allowed targets
-                if current_agent in execution_graph and next_agent != "final":
-                    allowed_targets = execution_graph.get(current_agent, [])
-                    if next_agent not in allowed_targets:
-                        logger.warning(f"Agent {current_agent} tried to delegate to {next_agent} but it's not allowed by execution graph")
-                        
-                        # If there are allowed targets, choose the first one
-                        if allowed_targets:
-                            agents = new_state["agents"]
-                            agents[current_agent] = dict(agents[current_agent])
-                            agents[current_agent]["next_agent"] = allowed_targets[0]
-                            
-                            # Add to history
-                            history_entry = {
-                                "timestamp": datetime.now().isoformat(),
-                                "agent": current_agent,
-                                "action": "graph_constraint_applied",
-                                "original_next": next_agent,
-                                "corrected_next": allowed_targets[0]
-                            }
-                            new_state["history"] = state.get("history", []) + [history_entry]
-                            
-                            return new_state
-            
-            # Add to history
-            history_entry = {
-                "timestamp": datetime.now().isoformat(),
-                "agent": current_agent,
-                "action": "route",
-                "next": next_agent
-            }
-            new_state["history"] = state.get("history", []) + [history_entry]
+                correction = {"next_agent": allowed_targets[0], "next_agents": [allowed_targets[0]]}
+                history_entry["action"] = "graph_constraint_applied"
+                del history_entry["next"]
+                history_entry["original_next"] = next_agent
+                history_entry["corrected_next"] = allowed_targets[0]
             
-            return new_state
+            # Fan-out targets the execution graph doesn't allow are dropped
+            else:
+                next_agents = agent_update.get("next_agents", agent_state["next_agents"])
+                if len(next_agents) > 1:
+                    permitted = [target for target in next_agents if target in allowed]
+                    if len(permitted) != len(next_agents):
+                        correction = {"next_agents": permitted}
+        
+        routed = {**update, "iteration": iteration, "history": update.get("history", []) + [history_entry]}
+        if correction:
+            routed["agents"] = {**update.get("agents", {}), agent_name: {**agent_update, **correction}}
+            agent_update = routed["agents"][agent_name]
         
-        return router_function
+        # Open connections to the next agents' providers while this super-step finishes
+        for target in agent_update.get("next_agents") or [agent_update.get("next_agent", next_agent)]:
+            if target in self._agent_providers:
+                self.llm_provider.schedule_prewarm(self._agent_providers[target])
+        return routed
     
     def _create_final_node(self):
         """Create the final output node function for the graph"""
         
-        def final_function(state: WorkflowState) -> WorkflowState:
+        def final_function(state: WorkflowState) -> Dict[str, Any]:
             logger.info("Generating final output")
             
-            new_state = dict(state)
-            
-            # Generate final output based on workflow type
-            if self.workflow_type == "supervisor" or self.workflow_type == "agentic":
-                # For supervisor, use the supervisor's final output
-                supervisor_name = None
-                for agent_name, agent_data in state["agents"].items():
-                    if agent_data.get("metadata", {}).get("role") == "supervisor":
-                        supervisor_name = agent_name
-                        break
-                
-                if supervisor_name:
-                    final_output = state["agents"][supervisor_name].get("outputs", {}).get("final", "")
-                    new_state["final_output"] = final_output
-            
-            elif self.workflow_type == "swarm":
-                # For swarm, use the last agent's output or combine all outputs
-                # This depends on the specific swarm configuration
-                interaction_type = self.template.config.get("workflow_config", {}).get("interaction_type")
-                
-                if interaction_type == "hub_and_spoke":
-                    # Use hub agent's final output
-                    hub_agent = self.template.config.get("workflow_config", {}).get("hub_agent")
-                    if hub_agent and hub_agent in state["agents"]:
-                        final_output = state["agents"][hub_agent].get("outputs", {}).get("final", "")
-                        new_state["final_output"] = final_output
-                else:
-                    # Use last agent's output in sequential mode
-                    history = state.get("history", [])
-                    agents = [entry["agent"] for entry in history if "agent" in entry]
-                    
-                    if agents:
-                        last_agent = agents[-1]
-                        final_output = state["agents"][last_agent].get("outputs", {}).get("final", "")
-                        new_state["final_output"] = final_output
-            
-            elif self.workflow_type == "rag":
-                # For RAG, use the RAG agent's output
-                rag_agent = "rag_agent"
-                final_output = state["agents"][rag_agent].get("outputs", {}).get("final", "")
-                new_state["final_output"] = final_output
-            
-            # If no specific output was generated, create one from all agent outputs
-            if not new_state.get("final_output"):
-                parts = []
-                
-                for agent_name, agent_data in state["agents"].items():
-                    output = agent_data.get("outputs", {}).get("final", "")
-                    if output:
-                        parts.append(f"{agent_name}: {output}")
-                
-                if parts:
-                    new_state["final_output"] = "\n\n".join(parts)
-                else:
-                    new_state["final_output"] = "No output was generated by any agent."
+            # Generate final output based on workflow type; if no specific output was generated,
+            # create one from all agent outputs (an empty join falls through to the default)
+            final_output = self._final_output_fn(state) or "\n\n".join([
+                f"{agent_name}: {output}"
+                for agent_name, agent_data in state["agents"].items()
+                if (output := agent_data["outputs"].get("final"))
+            ]) or "No output was generated by any agent."
             
             # Add to history
             history_entry = {
-                "timestamp": datetime.now().isoformat(),
+                "timestamp": time.time_ns() // 1000,
                 "action": "final_output"
             }
-            new_state["history"] = state.get("history", []) + [history_entry]
             
-            return new_state
+            return {"final_output": final_output, "history": [history_entry]}
         
         return final_function
     
-    def _get_next_agent(self, state: WorkflowState) -> str:
+    def _final_output_strategy(self):
+        """Pick the function that selects the final output for the workflow type"""
+        if self.workflow_type == "supervisor" or self.workflow_type == "agentic":
+            return self._supervisor_final_output
+        if self.workflow_type == "swarm":
+            if self.interaction_type == "hub_and_spoke":
+                return self._hub_final_output
+            return self._sequential_final_output
+        if self.workflow_type == "rag":
+            return self._rag_final_output
+        return lambda state: None
+    
+    def _supervisor_final_output(self, state: WorkflowState) -> Optional[str]:
+        """For supervisor, use the supervisor's final output"""
+        supervisor = state["agents"].get(self.entry_agent)
+        return supervisor["outputs"].get("final", "") if supervisor else None
+    
+    def _hub_final_output(self, state: WorkflowState) -> Optional[str]:
+        """For hub-and-spoke swarms, use the hub agent's final output"""
+        hub_agent = self.hub_agent
+        if hub_agent and hub_agent in state["agents"]:
+            return state["agents"][hub_agent]["outputs"].get("final", "")
+        return None
+    
+    def _sequential_final_output(self, state: WorkflowState) -> Optional[str]:
+        """For sequential swarms, use the last active agent's output"""
+        last_agent = next((entry["agent"] for entry in reversed(state["history"]) if "agent" in entry), None)
+        if last_agent is not None:
+            return state["agents"][last_agent]["outputs"].get("final", "")
+        return None
+    
+    def _rag_final_output(self, state: WorkflowState) -> Optional[str]:
+        """For RAG, use the RAG agent's output"""
+        return state["agents"]["rag_agent"]["outputs"].get("final", "")
+    
+    def _get_next_agent(self, state: WorkflowState) -> Union[str, List[Send]]:
         """
         Conditional routing function for deciding the next agent
         
-        This function is used by the router to determine where to route execution next.
+        This is the outgoing conditional edge of every agent node; it sees the state with that
+        agent's update (including the routing step) applied.
         """
         # Get current agent
         current_agent = state.get("current_agent")
         if not current_agent:
-            # Default to first agent if none specified
-            return list(state.get("agents", {}).keys())[0]
+            # Default to the entry agent if none specified
+            return self.entry_agent or "final"
+        
+        agents = state["agents"]
         
         # Get agent state
-        agent_state = state["agents"].get(current_agent, {})
+        agent_state = agents[current_agent]
+        
+        # Delegations to several agents fan out to all of them in the next super-step; their
+        # updates are merged by the state reducers before the next agent runs. Agents with no
+        # messages would have nothing to do, so they are never scheduled
+        next_agents = [
+            target for target in agent_state["next_agents"]
+            if target in agents and agents[target]["messages"]
+        ]
+        if len(next_agents) > 1 and self._parallel_fan_out:
+            return [Send(target, state) for target in next_agents]
         
         # Get next agent from the agent's state
-        next_agent = agent_state.get("next_agent")
+        next_agent = agent_state["next_agent"]
         
-        if next_agent and next_agent != "final":
-            # Make sure the next agent exists
-            if next_agent in state["agents"]:
-                # Update current agent in the state
-                state["current_agent"] = next_agent
-                return next_agent
+        # Routing only reads the state; the agent node that runs next records itself as the
+        # current agent in its own update
+        if next_agent and next_agent != "final" and next_agent in agents and agents[next_agent]["messages"]:
+            return next_agent
         
         # Default to final if no valid next agent
         return "final"
+    
+    def _create_initial_state(self, input_data: Dict[str, Any]) -> WorkflowState:
+        """Create the initial workflow state, handing the user query to the entry agent"""
+        entry_agent = self.entry_agent
+        agents = {
+            agent_config["name"]: _new_agent_state(agent_config["role"])
+            for agent_config in self.agent_configs
+        }
+        if entry_agent in agents:
+            agents[entry_agent]["messages"].append({
+                "role": "user",
+                "content": input_data.get("query", ""),
+                "from": "user"
+            })
+        
+        return {
+            "agents": agents,
+            "input": input_data,
+            "current_agent": entry_agent,
+            "history": [],
+            "final_output": None,
+            "execution_graph": {},
+            "iteration": 0,
+            "metadata": {
+                "workflow_type": self.workflow_type,
+                "execution_id": self.execution_id,
+                "started_at": time.time_ns() // 1000
+            },
+            "decisions": []
+        }
+    
+    async def _build_agent_prompt(
+        self,
+        agent_state: AgentState,
+        state: WorkflowState,
+        agent_config: Dict[str, Any]
+    ) -> str:
+        """Build an agent's prompt from its template, the workflow state and its latest message"""
+        input_query = state["input"].get("query", "")
+        agent_name = agent_config.get("name", "agent")
+        
+        prompt_chunks, used = self._agent_prompt_templates.get(agent_name) or self._resolve_prompt_template(agent_config)
+        values = {"input": input_query, "iteration": state.get("iteration", 0)}
+        
+        # Retrieval only runs when the agent has the tool and its template uses the result;
+        # it is started first so its round trip overlaps the rest of the prompt assembly
+        retrieval_task = None
+        if (
+            "retrieved_information" in used
+            and "retrieve_information" in agent_config.get("tools", [])
+            and "retrieve_information" in self.available_tools
+        ):
+            retrieval_task = asyncio.create_task(
+                self.available_tools["retrieve_information"]["function"](query=input_query, num_results=5)
+            )
+        
+        # Outputs produced so far by the other agents, only joined when the template uses them
+        for placeholder, empty_text in (("worker_outputs", "No worker outputs yet"), ("previous_outputs", "No previous outputs")):
+            if placeholder in used:
+                values[placeholder] = self._joined_outputs(state, placeholder, agent_name) or empty_text
+        
+        if "hub_output" in used:
+            hub_agent = self.hub_agent
+            values["hub_output"] = state["agents"][hub_agent]["outputs"].get("final", "") if hub_agent in state["agents"] else ""
+        
+        if retrieval_task is not None:
+            values["retrieved_information"] = await retrieval_task
+        elif "retrieved_information" in used:
+            values["retrieved_information"] = "No information retrieved"
+        
+        prompt = AgentPromptCreator.render_placeholders(prompt_chunks, values)
+        
+        # Messages from other agents since this agent's last turn are appended to the prompt;
+        # after a fan-out there is one per worker
+        messages = agent_state["messages"]
+        start = len(messages)
+        while start > 0 and messages[start - 1].get("role") != "assistant":
+            start -= 1
+        for message in messages[start:]:
+            if message.get("from", "user") != "user":
+                prompt = f"{prompt}\n\nMessage from {message['from']}:\n{message.get('content', '')}"
+        
+        return prompt
+    
+    def _resolve_prompt_template(self, agent_config: Dict[str, Any]) -> tuple:
+        """Resolve and compile an agent's prompt template, with the set of dynamic placeholders it uses"""
+        prompt_template = agent_config.get("prompt_template", "")
+        if not prompt_template:
+            if agent_config.get("role") == ROLE_RAG and "retrieve_information" in self.available_tools:
+                prompt_template = (
+                    "Use the following information to answer the question.\n\n"
+                    "Information:\n{retrieved_information}\n\nQuestion: {input}"
+                )
+            else:
+                prompt_template = "{input}"
+        
+        chunks = AgentPromptCreator.compile_placeholders(prompt_template)
+        used = frozenset(chunks[1::2]) & {"worker_outputs", "previous_outputs", "hub_output", "retrieved_information"}
+        return chunks, used
+    
+    def _process_agent_response(
+        self,
+        state: WorkflowState,
+        agent_name: str,
+        response: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """Record an agent's response and decide which agent runs next, returning the state update"""
+        content = response.get("content", "")
+        
+        agents = state["agents"]
+        agent_state = agents[agent_name]
+        
+        # Parse the agent's decision
+        context = {**self._parser_context_static, "iteration": state.get("iteration", 0)}
+        decision = self.decision_parser.parse_agent_decision(
+            content=content,
+            agent_name=agent_name,
+            agent_role=agent_state["metadata"]["role"],
+            context=context
+        )
+        
+        if content:
+            self._record_output(state, agent_name, content)
+        
+        # Record the agent's output; only the changed fields of changed agents are returned
+        agent_update = {
+            "messages": [{"role": "assistant", "content": content}],
+            "outputs": {**agent_state["outputs"], "final": content}
+        }
+        if decision.action_type == "use_tool" and decision.tool_name:
+            agent_update["tools_used"] = [decision.tool_name]
+        agents_update = {agent_name: agent_update}
+        
+        # Work out where to go next
+        agent_names = self._agent_names
+        targets = [
+            agent_names[target] for target in decision.targets
+            if target in agents and target != agent_name
+        ] if decision.action_type == "delegate" else []
+        
+        if targets:
+            next_agent = targets[0]
+            message_content = decision.content or content
+        elif decision.action_type == "final":
+            next_agent = "final"
+        else:
+            next_agent = self._default_next_agent(agent_name)
+            targets = [next_agent] if next_agent != "final" else []
+            message_content = content
+        
+        # Hand the content to each target; messages are never modified in place, so the targets
+        # share one message dict
+        if targets:
+            delegated_message = {
+                "role": "user",
+                "content": message_content,
+                "from": agent_name
+            }
+            for target in targets:
+                agents_update[target] = {"messages": [delegated_message]}
+        
+        agent_update["next_agent"] = next_agent
+        agent_update["next_agents"] = targets
+        
+        update = {"agents": agents_update, "current_agent": agent_name}
+        
+        # Track the dynamic execution graph and decisions
+        if targets:
+            update["execution_graph"] = {agent_name: targets}
+        
+        update["decisions"] = [decision.to_dict()]
+        
+        history_entry = {
+            "timestamp": time.time_ns() // 1000,
+            "agent": agent_name,
+            "action": decision.action_type,
+            "next": next_agent
+        }
+        update["history"] = [history_entry]
+        
+        return update
+    
+    def _record_output(self, state: WorkflowState, agent_name: str, output: str) -> None:
+        """Record an agent's latest output for the other agents' output placeholders"""
+        run_outputs = self._run_outputs.get(state["metadata"].get("execution_id"))
+        if run_outputs is None:
+            return
+        
+        line = f"{agent_name}: {output}"
+        run_outputs["previous_outputs"][agent_name] = line
+        if agent_name in self._workers:
+            run_outputs["worker_outputs"][agent_name] = line
+        run_outputs["joined"].clear()
+    
+    def _joined_outputs(self, state: WorkflowState, placeholder: str, agent_name: str) -> str:
+        """Other agents' output lines for a placeholder, joined once per new output"""
+        run_outputs = self._run_outputs.get(state["metadata"].get("execution_id"))
+        if run_outputs is None:
+            return ""
+        
+        joined = run_outputs["joined"]
+        key = (placeholder, agent_name)
+        if key not in joined:
+            joined[key] = "\n\n".join(
+                line for name, line in run_outputs[placeholder].items() if name != agent_name
+            )
+        return joined[key]
+    
+    def _default_next_agent(self, agent_name: str) -> str:
+        """Next agent when a response contains no explicit delegation or final marker"""
+        return self._default_next.get(agent_name, "final")
+    
+    def _default_routes(self) -> Dict[str, str]:
+        """Default next agent for each agent of the workflow, resolved once per runner"""
+        agent_names = [agent_config["name"] for agent_config in self.agent_configs]
+        
+        if self.workflow_type == "supervisor" or self.workflow_type == "agentic":
+            # Workers report back to the supervisor; the supervisor's own response is final
+            supervisor_name = agent_names[0] if agent_names else None
+            return {name: supervisor_name for name in agent_names[1:]}
+        
+        if self.workflow_type == "swarm":
+            if self.interaction_type == "hub_and_spoke":
+                hub_agent = self.entry_agent
+                return {name: hub_agent for name in agent_names if hub_agent and name != hub_agent}
+            
+            # Sequential swarms pass the turn to the next agent in order
+            return dict(zip(agent_names, agent_names[1:]))
+        
+        return {}
+    
+    def _process_final_state(self, final_state: WorkflowState, include_agent_usage: bool = True) -> Dict[str, Any]:
+        """Convert the final workflow state into the engine's result format"""
+        final_output = final_state.get("final_output") or ""
+        agents = final_state.get("agents", {})
+        outputs = {
+            name: output
+            for name, data in agents.items()
+            if (output := data["outputs"].get("final"))
+        }
+        
+        result = {
+            "final_output": final_output,
+            "messages": [
+                {"role": "user", "content": final_state.get("input", {}).get("query", "")},
+                {"role": "assistant", "content": final_output}
+            ],
+            "outputs": outputs,
+            "execution_graph": final_state.get("execution_graph", {}),
+            "decisions": final_state.get("decisions", []),
+            "history": [
+                {**entry, "timestamp": _format_timestamp(entry["timestamp"])}
+                if isinstance(entry.get("timestamp"), int) else entry
+                for entry in final_state.get("history", [])
+            ],
+            "iterations": final_state.get("iteration", 0)
+        }
+        if include_agent_usage:
+            agent_model_index = self._agent_model_index
+            result["agent_usage"] = [
+                {
+                    "agent": name,
+                    "role": agents[name]["metadata"]["role"],
+                    "model": agent_model_index.get(name, "vertex_ai/gemini-1.5-pro"),
+                    "output_length": len(output)
+                }
+                for name, output in outputs.items()
+            ]
+        return result
@@ -1,5 +1,9 @@
 # backend/app/engine/llm_providers.py
 import os
+import time
+import uuid
+import json
+import asyncio
 import logging
 from typing import Dict, Any, List, Optional, Union
 
@@ -13,17 +17,108 @@ except ImportError:
     LANGCHAIN_AVAILABLE = False
     logging.warning("LangChain libraries not available. Using fallback implementations.")
 
+# httpx is optional; without it each model keeps its SDK's own connection pool
+try:
+    import httpx
+    HTTPX_AVAILABLE = True
+except ImportError:
+    HTTPX_AVAILABLE = False
+
+# HTTP/2 lets concurrent agent calls share one connection per host when h2 is installed
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
 from app.core.config import settings
 
 logger = logging.getLogger(__name__)
 
+# Endpoints of providers whose models send requests through the shared HTTP client; a request
+# to them opens a keep-alive connection (TCP + TLS) ahead of the first model call
+PREWARM_URLS = {
+    "openai": "https://api.openai.com/v1/models",
+}
+
+# Connection limits of the shared HTTP client; every agent of every concurrent workflow shares
+# the pool, so it is sized for provider rate limits rather than httpx's default of 100
+HTTP_MAX_CONNECTIONS = 2000
+HTTP_MAX_KEEPALIVE_CONNECTIONS = 1500
+
+# Seconds before a request through the shared client times out (LLM calls can be slow)
+HTTP_TIMEOUT = 120.0
+
+# Seconds a warmed connection is assumed to stay in the keep-alive pool
+PREWARM_INTERVAL = 30.0
+
+# Provider batch endpoints used by generate_batch; batches complete within 24 hours at a
+# lower price than individual requests, so they suit bulk scoring and evaluation jobs
+OPENAI_API_URL = "https://api.openai.com/v1"
+ANTHROPIC_API_URL = "https://api.anthropic.com/v1"
+ANTHROPIC_API_VERSION = "2023-06-01"
+
+# Smaller batches aren't worth a provider batch's latency and are generated directly
+BATCH_API_MIN_REQUESTS = 20
+
+# Anthropic requires max_tokens on every request
+ANTHROPIC_DEFAULT_MAX_TOKENS = 1024
+
 class LLMProviderManager:
     """Manages connections to different LLM providers"""
     
     def __init__(self):
         self.providers = {}
+        self.http_client = self._create_http_client()
+        self._prewarmed_at: Dict[str, float] = {}
+        self._prewarm_tasks = set()
+        # Submitted batches by batch ID, and the batch IDs submitted for each execution
+        self.batches: Dict[str, Dict[str, Any]] = {}
+        self.execution_batches: Dict[str, List[str]] = {}
         self._initialize_providers()
     
+    def _create_http_client(self):
+        """Create the pooled async HTTP client shared by all models that accept one"""
+        if not HTTPX_AVAILABLE:
+            return None
+        return httpx.AsyncClient(
+            http2=HTTP2_AVAILABLE,
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS
+            ),
+            timeout=httpx.Timeout(HTTP_TIMEOUT)
+        )
+    
+    async def aclose(self):
+        """Close the shared HTTP client"""
+        if self.http_client is not None:
+            await self.http_client.aclose()
+    
+    def schedule_prewarm(self, provider_name: str) -> None:
+        """Warm the shared connection pool for a provider in the background, at most once per interval"""
+        if self.http_client is None or provider_name not in PREWARM_URLS:
+            return
+        provider = self.providers.get(provider_name)
+        if provider is None or provider.get("mock", False):
+            return
+        
+        now = time.monotonic()
+        if now - self._prewarmed_at.get(provider_name, float("-inf")) < PREWARM_INTERVAL:
+            return
+        self._prewarmed_at[provider_name] = now
+        
+        task = asyncio.ensure_future(self._prewarm(provider_name))
+        self._prewarm_tasks.add(task)
+        task.add_done_callback(self._prewarm_tasks.discard)
+    
+    async def _prewarm(self, provider_name: str) -> None:
+        """Open a keep-alive connection to the provider; the response itself is ignored"""
+        try:
+            await self.http_client.head(PREWARM_URLS[provider_name], timeout=5.0)
+        except Exception as e:
+            logger.debug(f"Prewarming {provider_name} connection failed: {str(e)}")
+    
     def _initialize_providers(self):
         """Initialize connections to available LLM providers"""
         # Initialize Vertex AI if configured
@@ -45,6 +140,7 @@ class LLMProviderManager:
     def _create_vertex_ai_provider(self):
         """Create a Vertex AI provider instance"""
         if LANGCHAIN_AVAILABLE:
+            # Models are built once per process, so the Google auth handshake isn't repeated per call
             return {
                 "models": {
                     "gemini-1.5-pro": ChatVertexAI(model_name="gemini-1.5-pro", project=settings.VERTEX_AI_PROJECT_ID),
@@ -57,11 +153,13 @@ class LLMProviderManager:
     def _create_openai_provider(self):
         """Create an OpenAI provider instance"""
         if LANGCHAIN_AVAILABLE:
+            # All OpenAI models reuse the shared connection pool instead of one pool each
+            client_options = {"http_async_client": self.http_client} if self.http_client is not None else {}
             return {
                 "models": {
-                    "gpt-4o": ChatOpenAI(model="gpt-4o", openai_api_key=settings.OPENAI_API_KEY),
-                    "gpt-4-turbo": ChatOpenAI(model="gpt-4-turbo", openai_api_key=settings.OPENAI_API_KEY),
-                    "gpt-3.5-turbo": ChatOpenAI(model="gpt-3.5-turbo", openai_api_key=settings.OPENAI_API_KEY),
+                    "gpt-4o": ChatOpenAI(model="gpt-4o", openai_api_key=settings.OPENAI_API_KEY, **client_options),
+                    "gpt-4-turbo": ChatOpenAI(model="gpt-4-turbo", openai_api_key=settings.OPENAI_API_KEY, **client_options),
+                    "gpt-3.5-turbo": ChatOpenAI(model="gpt-3.5-turbo", openai_api_key=settings.OPENAI_API_KEY, **client_options),
                 }
             }
         else:
@@ -70,6 +168,8 @@ class LLMProviderManager:
     def _create_anthropic_provider(self):
         """Create an Anthropic provider instance"""
         if LANGCHAIN_AVAILABLE:
+            # ChatAnthropic doesn't take an HTTP client; each model keeps the SDK client (and
+            # connection pool) it creates on first use, so the models are only built here
             return {
                 "models": {
                     "claude-3-opus": ChatAnthropic(model="claude-3-opus"),
@@ -106,9 +206,30 @@ class LLMProviderManager:
         
         return provider["models"][model_name]
     
+    def _build_messages(self, provider_name: str, prompt: str, system_message: Optional[str] = None,
+                        cache_prefix: bool = False) -> List[Dict[str, Any]]:
+        """
+        Build the chat messages for a prompt
+        
+        With cache_prefix the system message is marked as a prompt-cache breakpoint
+        for Anthropic; Gemini and OpenAI cache matching prefixes implicitly.
+        """
+        messages = []
+        if system_message:
+            if cache_prefix and provider_name == "anthropic":
+                messages.append({
+                    "role": "system",
+                    "content": [{"type": "text", "text": system_message, "cache_control": {"type": "ephemeral"}}]
+                })
+            else:
+                messages.append({"role": "system", "content": system_message})
+        
+        messages.append({"role": "user", "content": prompt})
+        return messages
+    
     async def generate_response(self, provider_name: str, model_name: str, prompt: str, 
                                system_message: Optional[str] = None, temperature: float = 0.7,
-                               max_tokens: Optional[int] = None, **kwargs):
+                               max_tokens: Optional[int] = None, cache_prefix: bool = False, **kwargs):
         """Generate a response from a specific model"""
         try:
             model = self.get_model(provider_name, model_name)
@@ -121,11 +242,7 @@ class LLMProviderManager:
                 }
             
             # Prepare messages
-            messages = []
-            if system_message:
-                messages.append({"role": "system", "content": system_message})
-            
-            messages.append({"role": "user", "content": prompt})
+            messages = self._build_messages(provider_name, prompt, system_message, cache_prefix)
             
             # Set parameters
             params = {
@@ -161,5 +278,273 @@ class LLMProviderManager:
                 "error": str(e)
             }
 
+    async def astream_response(self, provider_name: str, model_name: str, prompt: str,
+                               system_message: Optional[str] = None, temperature: float = 0.7,
+                               max_tokens: Optional[int] = None, cache_prefix: bool = False, **kwargs):
+        """
+        Stream a response from a specific model as text chunks
+        
+        Models that can't stream (including mocks) yield their whole response as one chunk.
+        """
+        model = self.get_model(provider_name, model_name)
+        if provider_name == "mock" or not hasattr(model, "astream"):
+            response = await self.generate_response(
+                provider_name, model_name, prompt, system_message=system_message,
+                temperature=temperature, max_tokens=max_tokens, cache_prefix=cache_prefix
+            )
+            yield response.get("content", "")
+            return
+        
+        messages = self._build_messages(provider_name, prompt, system_message, cache_prefix)
+        params = {"temperature": temperature}
+        if max_tokens:
+            params["max_tokens"] = max_tokens
+        
+        async for chunk in model.astream(messages, **params):
+            if chunk.content:
+                yield chunk.content
+
+    async def generate_response_batch(self, requests: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Generate responses for several prompts concurrently
+        
+        Each request takes the same keyword arguments as generate_response and is sent as its
+        own call, so a failing prompt only fails its own response. Responses are returned in
+        request order.
+        """
+        return list(await asyncio.gather(*[self.generate_response(**request) for request in requests]))
+
+    async def generate_batch(self, provider_name: str, model_name: str, prompts: List[str],
+                             system_message: Optional[str] = None, temperature: float = 0.7,
+                             max_tokens: Optional[int] = None, execution_id: Optional[str] = None) -> str:
+        """
+        Submit a bulk job of prompts for one model, returning a batch ID for poll_batch
+        
+        OpenAI and Anthropic jobs of at least BATCH_API_MIN_REQUESTS prompts go through the
+        provider's Batch API; other jobs (Vertex AI, mocks, small batches) are generated right
+        away with generate_response_batch. Results are keyed by custom ID, the prompt's index.
+        """
+        custom_ids = [str(index) for index in range(len(prompts))]
+        batch = {
+            "provider_name": provider_name,
+            "model_name": model_name,
+            "custom_ids": custom_ids,
+            "execution_id": execution_id
+        }
+        
+        provider = self.providers.get(provider_name, {})
+        use_batch_api = (
+            self.http_client is not None
+            and provider_name in ("openai", "anthropic")
+            and not provider.get("mock", False)
+            and len(prompts) >= BATCH_API_MIN_REQUESTS
+        )
+        
+        if use_batch_api:
+            submit = self._submit_openai_batch if provider_name == "openai" else self._submit_anthropic_batch
+            batch_id = await submit(model_name, custom_ids, prompts, system_message, temperature, max_tokens, execution_id)
+        else:
+            responses = await self.generate_response_batch([
+                {
+                    "provider_name": provider_name,
+                    "model_name": model_name,
+                    "prompt": prompt,
+                    "system_message": system_message,
+                    "temperature": temperature,
+                    "max_tokens": max_tokens
+                }
+                for prompt in prompts
+            ])
+            batch_id = f"local-{uuid.uuid4().hex}"
+            batch["results"] = dict(zip(custom_ids, responses))
+        
+        self.batches[batch_id] = batch
+        if execution_id:
+            self.execution_batches.setdefault(execution_id, []).append(batch_id)
+        return batch_id
+    
+    async def poll_batch(self, batch_id: str, provider_name: Optional[str] = None,
+                         model_name: Optional[str] = None,
+                         custom_ids: Optional[List[str]] = None) -> Optional[Dict[str, Dict[str, Any]]]:
+        """
+        Return a batch's responses by custom ID, or None while the provider is still processing it
+        
+        Requests the provider couldn't complete get an error response, as in generate_response.
+        Provider batches this process doesn't know about (submitted before a restart or by
+        another worker) are polled with the provider and model they were submitted with;
+        custom_ids are the IDs expected back (generate_batch uses "0", "1", ... in prompt order),
+        and without them every result the provider returns is passed on.
+        """
+        batch = self.batches.get(batch_id)
+        if batch is None:
+            if provider_name not in ("openai", "anthropic") or not model_name:
+                raise ValueError(f"Unknown batch: {batch_id}")
+            batch = {
+                "provider_name": provider_name,
+                "model_name": model_name,
+                "custom_ids": custom_ids,
+                "execution_id": None
+            }
+        
+        if "results" not in batch:
+            if batch["provider_name"] == "openai":
+                results = await self._poll_openai_batch(batch_id, batch)
+            else:
+                results = await self._poll_anthropic_batch(batch_id, batch)
+            if results is None:
+                return None
+            model = f"{batch['provider_name']}/{batch['model_name']}"
+            for response in results.values():
+                response["model"] = model
+            batch["results"] = results
+        
+        # Completed batches are handed over once
+        self.batches.pop(batch_id, None)
+        execution_id = batch["execution_id"]
+        if execution_id in self.execution_batches:
+            self.execution_batches[execution_id].remove(batch_id)
+            if not self.execution_batches[execution_id]:
+                del self.execution_batches[execution_id]
+        
+        if batch["custom_ids"] is None:
+            return batch["results"]
+        
+        missing = {
+            "content": "Error generating response: no result returned for request",
+            "model": f"{batch['provider_name']}/{batch['model_name']}",
+            "error": "no result returned for request"
+        }
+        return {
+            custom_id: batch["results"].get(custom_id) or dict(missing)
+            for custom_id in batch["custom_ids"]
+        }
+    
+    async def _submit_openai_batch(self, model_name: str, custom_ids: List[str], prompts: List[str],
+                                   system_message: Optional[str], temperature: float,
+                                   max_tokens: Optional[int], execution_id: Optional[str]) -> str:
+        """Upload the requests as a JSONL file and create an OpenAI batch over it"""
+        headers = {"Authorization": f"Bearer {settings.OPENAI_API_KEY}"}
+        lines = []
+        for custom_id, prompt in zip(custom_ids, prompts):
+            body = {
+                "model": model_name,
+                "messages": self._build_messages("openai", prompt, system_message),
+                "temperature": temperature
+            }
+            if max_tokens:
+                body["max_tokens"] = max_tokens
+            lines.append(json.dumps({
+                "custom_id": custom_id,
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": body
+            }))
+        
+        upload = await self.http_client.post(
+            f"{OPENAI_API_URL}/files",
+            headers=headers,
+            data={"purpose": "batch"},
+            files={"file": ("batch.jsonl", "\n".join(lines).encode(), "application/jsonl")}
+        )
+        upload.raise_for_status()
+        
+        response = await self.http_client.post(
+            f"{OPENAI_API_URL}/batches",
+            headers=headers,
+            json={
+                "input_file_id": upload.json()["id"],
+                "endpoint": "/v1/chat/completions",
+                "completion_window": "24h",
+                "metadata": {"execution_id": execution_id} if execution_id else {}
+            }
+        )
+        response.raise_for_status()
+        return response.json()["id"]
+    
+    async def _poll_openai_batch(self, batch_id: str, batch: Dict[str, Any]) -> Optional[Dict[str, Dict[str, Any]]]:
+        """Download an OpenAI batch's output and error files once it has finished"""
+        headers = {"Authorization": f"Bearer {settings.OPENAI_API_KEY}"}
+        response = await self.http_client.get(f"{OPENAI_API_URL}/batches/{batch_id}", headers=headers)
+        response.raise_for_status()
+        status = response.json()
+        if status["status"] not in ("completed", "failed", "expired", "cancelled"):
+            return None
+        
+        results = {}
+        for file_id in (status.get("output_file_id"), status.get("error_file_id")):
+            if not file_id:
+                continue
+            content = await self.http_client.get(f"{OPENAI_API_URL}/files/{file_id}/content", headers=headers)
+            content.raise_for_status()
+            for line in content.text.splitlines():
+                if not line:
+                    continue
+                item = json.loads(line)
+                body = (item.get("response") or {}).get("body") or {}
+                if item.get("error") or "choices" not in body:
+                    error = item.get("error") or body.get("error") or "Request failed"
+                    results[item["custom_id"]] = {"content": f"Error generating response: {error}", "error": str(error)}
+                else:
+                    results[item["custom_id"]] = {"content": body["choices"][0]["message"]["content"]}
+        
+        if status["status"] != "completed":
+            error = f"Batch {status['status']}"
+            for custom_id in batch["custom_ids"] or ():
+                results.setdefault(custom_id, {"content": f"Error generating response: {error}", "error": error})
+        return results
+    
+    async def _submit_anthropic_batch(self, model_name: str, custom_ids: List[str], prompts: List[str],
+                                      system_message: Optional[str], temperature: float,
+                                      max_tokens: Optional[int], execution_id: Optional[str]) -> str:
+        """Create an Anthropic message batch"""
+        requests = []
+        for custom_id, prompt in zip(custom_ids, prompts):
+            params = {
+                "model": model_name,
+                "max_tokens": max_tokens or ANTHROPIC_DEFAULT_MAX_TOKENS,
+                "temperature": temperature,
+                "messages": [{"role": "user", "content": prompt}]
+            }
+            if system_message:
+                params["system"] = system_message
+            requests.append({"custom_id": custom_id, "params": params})
+        
+        response = await self.http_client.post(
+            f"{ANTHROPIC_API_URL}/messages/batches",
+            headers=self._anthropic_headers(),
+            json={"requests": requests}
+        )
+        response.raise_for_status()
+        return response.json()["id"]
+    
+    async def _poll_anthropic_batch(self, batch_id: str, batch: Dict[str, Any]) -> Optional[Dict[str, Dict[str, Any]]]:
+        """Download an Anthropic message batch's results once processing has ended"""
+        headers = self._anthropic_headers()
+        response = await self.http_client.get(f"{ANTHROPIC_API_URL}/messages/batches/{batch_id}", headers=headers)
+        response.raise_for_status()
+        status = response.json()
+        if status["processing_status"] != "ended":
+            return None
+        
+        content = await self.http_client.get(status["results_url"], headers=headers)
+        content.raise_for_status()
+        results = {}
+        for line in content.text.splitlines():
+            if not line:
+                continue
+            item = json.loads(line)
+            result = item["result"]
+            if result["type"] == "succeeded":
+                text = "".join(block.get("text", "") for block in result["message"]["content"])
+                results[item["custom_id"]] = {"content": text}
+            else:
+                error = result.get("error") or result["type"]
+                results[item["custom_id"]] = {"content": f"Error generating response: {error}", "error": str(error)}
+        return results
+    
+    def _anthropic_headers(self) -> Dict[str, str]:
+        """Headers for Anthropic API requests"""
+        return {"x-api-key": settings.ANTHROPIC_API_KEY, "anthropic-version": ANTHROPIC_API_VERSION}
+
 # Create a global instance
 llm_provider_manager = LLMProviderManager()
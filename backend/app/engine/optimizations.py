@@ -269,13 +269,33 @@ async def throttled_api_call(provider: str, func, *args, **kwargs):
     return await func(*args, **kwargs)
 
 # Parallel processing for agent workflows
-async def parallel_agent_execution(agent_funcs: List[Callable], max_workers: int = 5) -> List[Any]:
+async def cancel_pending(tasks: List[asyncio.Future]) -> None:
+    """
+    Cancel unfinished tasks and wait for them to unwind
+    
+    Awaiting the cancelled tasks lets in-flight provider calls close their
+    connections instead of running on in the background.
+    
+    Args:
+        tasks: Tasks to cancel
+    """
+    pending = [task for task in tasks if not task.done()]
+    for task in pending:
+        task.cancel()
+    
+    if pending:
+        await asyncio.gather(*pending, return_exceptions=True)
+
+async def parallel_agent_execution(agent_funcs: List[Callable], max_workers: int = 5,
+                                   stop_when: Optional[Callable[[Any], bool]] = None) -> List[Any]:
     """
     Execute multiple agent functions in parallel
     
     Args:
         agent_funcs: List of agent functions to execute
         max_workers: Maximum number of parallel workers
+        stop_when: Optional predicate on a result; once it returns True the
+            remaining functions are cancelled and their results are None
         
     Returns:
         List of results
@@ -292,8 +312,108 @@ async def parallel_agent_execution(agent_funcs: List[Callable], max_workers: int
                 return {"error": str(e), "traceback": traceback.format_exc()}
     
     # Execute all functions in parallel with bounded concurrency
-    tasks = [bounded_execution(func) for func in agent_funcs]
-    return await asyncio.gather(*tasks)
+    if stop_when is None:
+        tasks = [bounded_execution(func) for func in agent_funcs]
+        return await asyncio.gather(*tasks)
+    
+    tasks = [asyncio.ensure_future(bounded_execution(func)) for func in agent_funcs]
+    pending = set(tasks)
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            if any(stop_when(task.result()) for task in done):
+                logger.info("Stop condition met, cancelling remaining agent executions")
+                break
+    finally:
+        await cancel_pending(tasks)
+    
+    return [None if task.cancelled() else task.result() for task in tasks]
+
+# Micro-batching of concurrent requests
+class MicroBatcher:
+    """
+    Coalesce requests that arrive within a short window into one batch call
+    
+    Callers await submit() as if they were making a single request; items that
+    arrive within max_wait seconds of each other are flushed together through
+    batch_func, which must return one result per item in the same order.
+    """
+    
+    def __init__(self, batch_func: Callable[[List[Any]], Any], max_wait: float = 0.02,
+                 max_batch_size: int = 32):
+        """
+        Initialize the micro-batcher
+        
+        Args:
+            batch_func: Async function taking a list of items and returning a list of results
+            max_wait: Maximum time in seconds to wait for more items before flushing
+            max_batch_size: Flush immediately once this many items are pending
+        """
+        self.batch_func = batch_func
+        self.max_wait = max_wait
+        self.max_batch_size = max_batch_size
+        self._pending: List[Any] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._flush_tasks = set()
+    
+    async def submit(self, item: Any) -> Any:
+        """
+        Submit an item and wait for its result
+        
+        Args:
+            item: Item to include in the next batch
+            
+        Returns:
+            Result for this item
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+        
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        
+        return await future
+    
+    def _flush(self) -> None:
+        """Send all pending items as one batch"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        
+        task = asyncio.ensure_future(self._run_batch(batch))
+        self._flush_tasks.add(task)
+        task.add_done_callback(self._flush_tasks.discard)
+    
+    async def _run_batch(self, batch: List[Any]) -> None:
+        """Execute a batch and resolve the waiting futures"""
+        try:
+            results = await self.batch_func([item for item, _ in batch])
+        except Exception as e:
+            logger.error(f"Error in batched execution: {e}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        
+        results = list(results or ())
+        if len(results) != len(batch):
+            logger.error(f"Batched execution returned {len(results)} results for {len(batch)} items")
+        
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+        
+        # Items without a result would otherwise wait forever
+        for _, future in batch[len(results):]:
+            if not future.done():
+                future.set_exception(RuntimeError("Batched execution returned no result for this item"))
 
 # Progressive response handling
 class ProgressiveResponse:
@@ -476,6 +596,21 @@ def optimize_memory_usage(max_history_length: int = 10):
     return decorator
 
 # Execution checkpointing for long-running workflows
+# Directories already created by ensure_dir in this process
+_ENSURED_DIRS: set = set()
+
+def ensure_dir(path: str) -> None:
+    """
+    Create a directory if needed, only touching the filesystem the first time a path is seen
+    
+    Args:
+        path: Directory to create
+    """
+    if path in _ENSURED_DIRS:
+        return
+    os.makedirs(path, exist_ok=True)
+    _ENSURED_DIRS.add(path)
+
 class WorkflowCheckpointer:
     """
     Save and restore workflow state for long-running workflows
@@ -492,7 +627,7 @@ class WorkflowCheckpointer:
             checkpoint_dir: Directory to store checkpoints
         """
         self.checkpoint_dir = checkpoint_dir
-        os.makedirs(checkpoint_dir, exist_ok=True)
+        ensure_dir(checkpoint_dir)
     
     async def save_checkpoint(self, execution_id: str, state: Dict[str, Any]) -> str:
         """
@@ -589,7 +724,7 @@ import logging
 # Make the optimizations available for import
 __all__ = [
     "LRUCache", "cached_llm_call", "RequestThrottler", "throttled_api_call",
-    "parallel_agent_execution", "ProgressiveResponse", "with_timeout",
+    "cancel_pending", "parallel_agent_execution", "MicroBatcher", "ProgressiveResponse", "with_timeout",
     "WorkflowExecutionError", "with_retries", "optimize_memory_usage",
-    "WorkflowCheckpointer"
+    "ensure_dir", "WorkflowCheckpointer"
 ]
@@ -105,9 +105,9 @@ class EnhancedRAGTool:
                 # Format metadata if requested and available
                 metadata_text = ""
                 if include_metadata and hasattr(doc, "metadata") and doc.metadata:
-                    metadata_text = "\nMetadata:\n"
-                    for key, value in doc.metadata.items():
-                        metadata_text += f"  {key}: {value}\n"
+                    metadata_text = "\nMetadata:\n" + "".join(
+                        f"  {key}: {value}\n" for key, value in doc.metadata.items()
+                    )
                 
                 # Format result
                 results.append(
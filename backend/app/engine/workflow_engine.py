@@ -3,12 +3,15 @@ import logging
 import json
 import asyncio
 import os
+import time
 from typing import Dict, List, Any, Optional, Union
 from datetime import datetime
 import uuid
 from pathlib import Path
 
 from app.engine.llm_providers import llm_provider_manager
+from app.engine.agent_prompt_creator import AgentPromptCreator
+from app.engine.optimizations import LRUCache, ensure_dir
 from app.core.config import settings
 from app.db.models import Template, Workflow, WorkflowExecution, ExecutionLog
 from app.engine.tools.rag_tool import RAGTool
@@ -16,6 +19,10 @@ from app.db.vector_store import VectorStoreManager
 
 logger = logging.getLogger(__name__)
 
+# Merged template/workflow configs keyed by the ids and update times of both rows.
+# Cached configs are shared between executions and must be treated as read-only.
+merged_config_cache: LRUCache[Dict[str, Any]] = LRUCache(max_size=256)
+
 class WorkflowEngine:
     """Base engine for executing all types of workflows based on templates"""
     
@@ -24,26 +31,28 @@ class WorkflowEngine:
         self.rag_tool = RAGTool(vector_store_manager=VectorStoreManager())
         self.registered_tools = {
             "retrieve_information": self.rag_tool.retrieve_information
-        }   
+        }
+        
+        # Per-run cache of in-flight retrievals, keyed by (query, num_results)
+        self._current_rag_cache: Optional[Dict[tuple, asyncio.Task]] = None
 
     async def execute_workflow(self, template: Template, workflow: Workflow, input_data: Dict[str, Any]) -> Dict[str, Any]:
         """Execute a workflow with the given input data using its template"""
         logger.info(f"Executing workflow: {workflow.name} (ID: {workflow.id})")
         
-        start_time = datetime.now()
+        start_time = time.perf_counter()
+        self._current_rag_cache = {}
         
         try:
             # Extract configuration from template and workflow
             workflow_type = template.workflow_type
-            template_config = template.config
-            workflow_config = workflow.config
             
             # Merge template and workflow configs, with workflow config taking precedence
-            merged_config = self._merge_configs(template_config, workflow_config)      
+            merged_config = self._get_merged_config(template, workflow)
 
             # Create checkpoint directory if needed
             checkpoint_dir = merged_config.get("workflow_config", {}).get("checkpoint_dir", settings.CHECKPOINT_DIR)
-            os.makedirs(checkpoint_dir, exist_ok=True)
+            ensure_dir(checkpoint_dir)
             
             # Execute based on workflow type
             if workflow_type == "rag":
@@ -59,7 +68,7 @@ class WorkflowEngine:
             else:
                 raise ValueError(f"Unsupported workflow type: {workflow_type}")
             
-            execution_time = (datetime.now() - start_time).total_seconds()
+            execution_time = time.perf_counter() - start_time
             logger.info(f"Workflow execution completed in {execution_time:.2f} seconds")
             
             return {
@@ -70,13 +79,29 @@ class WorkflowEngine:
             
         except Exception as e:
             logger.exception(f"Error executing workflow: {str(e)}")
-            execution_time = (datetime.now() - start_time).total_seconds()
+            execution_time = time.perf_counter() - start_time
             
             return {
                 "success": False,
                 "error": str(e),
                 "execution_time": execution_time
             }
+        
+        finally:
+            self._current_rag_cache = None
+
+    def _get_merged_config(self, template: Template, workflow: Workflow) -> Dict[str, Any]:
+        """Merge template and workflow configs, reusing the result while neither row has changed"""
+        # Transient rows (e.g. an in-memory enhanced template) have no update time to key on
+        if template.updated_at is None or workflow.updated_at is None:
+            return self._merge_configs(template.config, workflow.config)
+        
+        key = f"{template.id}:{template.updated_at.isoformat()}:{workflow.id}:{workflow.updated_at.isoformat()}"
+        merged = merged_config_cache.get(key)
+        if merged is None:
+            merged = self._merge_configs(template.config, workflow.config)
+            merged_config_cache.put(key, merged)
+        return merged
 
     def _merge_configs(self, template_config: Dict[str, Any], workflow_config: Dict[str, Any]) -> Dict[str, Any]:
         """Merge template and workflow configurations, with workflow config taking precedence"""
@@ -170,23 +195,27 @@ Context:
         supervisor_prompt_template = supervisor.get("prompt_template", "")
         supervisor_system_message = supervisor.get("system_message", "")
         
-        # Replace placeholders in prompt template
-        supervisor_prompt = supervisor_prompt_template.replace("{input}", query)
-        
-        # Add available workers information to prompt
-        workers_info = "\n\nAvailable workers:\n" + "\n".join([
+        # The workers and tools lists don't change between runs of a workflow, so they go
+        # first to give providers a stable, cacheable prompt prefix
+        prompt_parts = ["Available workers:\n"]
+        prompt_parts.append("\n".join([
             f"- {worker.get('name', 'unnamed')}: {worker.get('role', 'worker')} - {worker.get('description', 'No description')}"
             for worker in workers
-        ])
-        supervisor_prompt += workers_info
+        ]))
 
         # Add available tools information if any
         if tools:
-            tools_info = "\n\nAvailable tools:\n" + "\n".join([
+            prompt_parts.append("\n\nAvailable tools:\n")
+            prompt_parts.append("\n".join([
                 f"- {tool.get('name', 'unnamed')}: {tool.get('description', 'No description')}" 
                 for tool in tools
-            ])
-            supervisor_prompt += tools_info
+            ]))
+        
+        # Replace placeholders in prompt template
+        prompt_parts.append("\n\n")
+        prompt_parts.append(AgentPromptCreator.fill_placeholders(supervisor_prompt_template, input=query))
+        
+        supervisor_prompt = "".join(prompt_parts)
             
         # Get supervisor response
         supervisor_response = await self.llm_provider.generate_response(
@@ -195,7 +224,8 @@ Context:
             prompt=supervisor_prompt,
             system_message=supervisor_system_message,
             temperature=supervisor.get("temperature", 0.7),
-            max_tokens=supervisor.get("max_tokens")
+            max_tokens=supervisor.get("max_tokens"),
+            cache_prefix=True
         )
         
         logger.info(f"Supervisor response received")
@@ -204,6 +234,10 @@ Context:
         worker_outputs = {}
         worker_usage = []
         
+        # Formatted "name: output" entries, kept alongside worker_outputs so context and
+        # synthesis prompts don't re-format every earlier output for each worker
+        worker_output_lines = {}
+        
         max_iterations = workflow_config.get("max_iterations", 3)
         current_iteration = 0
 
@@ -211,39 +245,46 @@ Context:
         # For now, we'll use a simple approach and use all workers
         # In a more advanced implementation, you could parse the response to determine this
         selected_workers = workers
+        
+        # Assign positional fallback names once so unnamed workers keep the same name across iterations
+        worker_names = [worker.get("name") or f"worker_{i}" for i, worker in enumerate(selected_workers)]
 
         while current_iteration < max_iterations:
             current_iteration += 1
             logger.info(f"Starting worker iteration {current_iteration}/{max_iterations}")
             
-            for worker in selected_workers:
-                worker_name = worker.get("name", f"worker_{uuid.uuid4().hex[:8]}")
+            for worker, worker_name in zip(selected_workers, worker_names):
                 worker_role = worker.get("role", "worker")
                 worker_model_provider = worker.get("model_provider", "vertex_ai")
                 worker_model_name = worker.get("model_name", "gemini-1.5-flash")
                 worker_prompt_template = worker.get("prompt_template", "")
                 worker_system_message = worker.get("system_message", "")
             
-                # Replace placeholders in prompt template
-                worker_prompt = worker_prompt_template.replace("{input}", query)
-                worker_prompt = worker_prompt.replace("{supervisor_response}", supervisor_response.get("content", ""))
-                
                 # Add context from other workers if available
-                if worker_outputs:
-                    context = "\n\n".join([f"{name}: {output}" for name, output in worker_outputs.items()])
-                    worker_prompt = worker_prompt.replace("{worker_outputs}", context)
+                if "{worker_outputs}" not in worker_prompt_template:
+                    context = ""
+                elif worker_output_lines:
+                    context = "\n\n".join(worker_output_lines.values())
                 else:
-                    worker_prompt = worker_prompt.replace("{worker_outputs}", "No worker outputs yet")
+                    context = "No worker outputs yet"
 
-                # Check if worker has tools and process them
+                # Check if worker has tools and process them (skipped when the template can't use the result)
                 worker_tools = worker.get("tools", [])
-                if worker_tools and "retrieve_information" in worker_tools:
+                if worker_tools and "retrieve_information" in worker_tools and "{retrieved_information}" in worker_prompt_template:
                     # Worker has RAG capabilities, retrieve relevant information
                     logger.info(f"Worker {worker_name} is using RAG capabilities")
-                    rag_results = await self.execute_tool("retrieve_information", query=query, num_results=5)
-                    worker_prompt = worker_prompt.replace("{retrieved_information}", rag_results)
+                    rag_results = await self._cached_retrieve(query, 5)
                 else:
-                    worker_prompt = worker_prompt.replace("{retrieved_information}", "No information retrieved")
+                    rag_results = "No information retrieved"
+                
+                # Replace placeholders in prompt template
+                worker_prompt = AgentPromptCreator.fill_placeholders(
+                    worker_prompt_template,
+                    input=query,
+                    supervisor_response=supervisor_response.get("content", ""),
+                    worker_outputs=context,
+                    retrieved_information=rag_results
+                )
                     
                 logger.info(f"Executing worker: {worker_name}")
                 
@@ -254,11 +295,13 @@ Context:
                     prompt=worker_prompt,
                     system_message=worker_system_message,
                     temperature=worker.get("temperature", 0.7),
-                    max_tokens=worker.get("max_tokens")
+                    max_tokens=worker.get("max_tokens"),
+                    cache_prefix=True
                 )
 
                 worker_output = worker_response.get("content", "")
                 worker_outputs[worker_name] = worker_output
+                worker_output_lines[worker_name] = f"{worker_name}: {worker_output}"
                 
                 worker_usage.append({
                     "iteration": current_iteration,
@@ -276,9 +319,11 @@ Context:
             
         # 3. Final response: Have supervisor synthesize worker outputs
         if current_iteration > 0 and len(worker_outputs) > 0:
-            synthesis_prompt = f"Based on your initial analysis and the work from your team, provide a final response to: {query}\n\n"
-            synthesis_prompt += "Worker outputs:\n"
-            synthesis_prompt += "\n\n".join([f"{name}: {output}" for name, output in worker_outputs.items()])
+            synthesis_prompt = "".join([
+                f"Based on your initial analysis and the work from your team, provide a final response to: {query}\n\n",
+                "Worker outputs:\n",
+                "\n\n".join(worker_output_lines.values())
+            ])
             
             final_response = await self.llm_provider.generate_response(
                 provider_name=supervisor_model_provider,
@@ -286,7 +331,8 @@ Context:
                 prompt=synthesis_prompt,
                 system_message=supervisor_system_message,
                 temperature=supervisor.get("temperature", 0.5),  # Lower temperature for synthesis
-                max_tokens=supervisor.get("max_tokens")
+                max_tokens=supervisor.get("max_tokens"),
+                cache_prefix=True
             )
             
             final_output = final_response.get("content", "")
@@ -330,37 +376,52 @@ Context:
             # Sequential processing - each agent processes in turn
             previous_outputs = {}
             
+            # With a convergence_threshold configured, iterations stop early once no agent's
+            # output differs from its previous one by more than it (off by default)
+            convergence_threshold = workflow_config.get("convergence_threshold")
+            output_history = {}
+            
+            # Assign positional fallback names once so unnamed agents keep the same name across iterations
+            agent_names = [agent.get("name") or f"agent_{i}" for i, agent in enumerate(agents)]
+            
             for iteration in range(max_iterations):
                 logger.info(f"Starting sequential iteration {iteration+1}/{max_iterations}")
                 iteration_outputs = {}
                 
-                for agent in agents:
-                    agent_name = agent.get("name", f"agent_{uuid.uuid4().hex[:8]}")
+                # Previous outputs are fixed for the whole iteration, so their text is built
+                # on first use and shared by every agent in this iteration
+                previous_outputs_text = None
+                
+                for agent, agent_name in zip(agents, agent_names):
                     agent_role = agent.get("role", "agent")
                     agent_model_provider = agent.get("model_provider", "vertex_ai")
                     agent_model_name = agent.get("model_name", "gemini-1.5-flash")
                     agent_prompt_template = agent.get("prompt_template", "")
                     agent_system_message = agent.get("system_message", "")
                     
-                    # Replace placeholders in prompt template
-                    agent_prompt = agent_prompt_template.replace("{input}", query)
-                    
                     # Add previous outputs to context if any
-                    if previous_outputs:
-                        previous_outputs_text = "\n\n".join([f"{name}: {output}" for name, output in previous_outputs.items()])
-                        agent_prompt = agent_prompt.replace("{previous_outputs}", previous_outputs_text)
-                    else:
-                        agent_prompt = agent_prompt.replace("{previous_outputs}", "No previous outputs")
+                    if previous_outputs_text is None and "{previous_outputs}" in agent_prompt_template:
+                        if previous_outputs:
+                            previous_outputs_text = "\n\n".join([f"{name}: {output}" for name, output in previous_outputs.items()])
+                        else:
+                            previous_outputs_text = "No previous outputs"
 
-                    # Check if agent has RAG capabilities
+                    # Check if agent has RAG capabilities (skipped when the template can't use the result)
                     agent_tools = agent.get("tools", [])
-                    if agent_tools and "retrieve_information" in agent_tools:
+                    if agent_tools and "retrieve_information" in agent_tools and "{retrieved_information}" in agent_prompt_template:
                         # Agent has RAG capabilities, retrieve relevant information
                         logger.info(f"Agent {agent_name} is using RAG capabilities")
-                        rag_results = await self.execute_tool("retrieve_information", query=query, num_results=5)
-                        agent_prompt = agent_prompt.replace("{retrieved_information}", rag_results)
+                        rag_results = await self._cached_retrieve(query, 5)
                     else:
-                        agent_prompt = agent_prompt.replace("{retrieved_information}", "No information retrieved")
+                        rag_results = "No information retrieved"
+                    
+                    # Replace placeholders in prompt template
+                    agent_prompt = AgentPromptCreator.fill_placeholders(
+                        agent_prompt_template,
+                        input=query,
+                        previous_outputs=previous_outputs_text or "",
+                        retrieved_information=rag_results
+                    )
                         
                     logger.info(f"Executing agent: {agent_name}")
                     
@@ -371,7 +432,8 @@ Context:
                         prompt=agent_prompt,
                         system_message=agent_system_message,
                         temperature=agent.get("temperature", 0.7),
-                        max_tokens=agent.get("max_tokens")
+                        max_tokens=agent.get("max_tokens"),
+                        cache_prefix=True
                     )
                     
                     output = agent_response.get("content", "")
@@ -400,11 +462,27 @@ Context:
                 if stop_iteration:
                     logger.info("Stopping iterations due to agent request")
                     break
+                
+                # Check if agent outputs have converged
+                if convergence_threshold is not None:
+                    # Only outputs that changed since the last iteration need comparing; unchanged
+                    # ones keep their existing entry (and its cached tokens)
+                    changed_entries = {
+                        name: self._tokenize_output(output)
+                        for name, output in iteration_outputs.items()
+                        if name not in output_history or output_history[name]["output"] != output
+                    }
+                    if output_history and self._check_convergence(changed_entries, output_history, convergence_threshold):
+                        logger.info("Stopping iterations due to converged agent outputs")
+                        break
+                    output_history.update(changed_entries)
             
             # Generate a final synthesis
             final_agent = agents[-1]  # Use the last agent for synthesis
-            final_prompt = f"Synthesize the following outputs to provide a final, comprehensive answer to the query: '{query}'\n\n"
-            final_prompt += "\n\n".join([f"{name}: {output}" for name, output in agent_outputs.items()])
+            final_prompt = "".join([
+                f"Synthesize the following outputs to provide a final, comprehensive answer to the query: '{query}'\n\n",
+                "\n\n".join([f"{name}: {output}" for name, output in agent_outputs.items()])
+            ])
             
             final_response = await self.llm_provider.generate_response(
                 provider_name=final_agent.get("model_provider", "vertex_ai"),
@@ -430,7 +508,7 @@ Context:
             # First, hub agent processes the query
             hub_prompt_template = hub_agent.get("prompt_template", "")
             hub_system_message = hub_agent.get("system_message", "")
-            hub_prompt = hub_prompt_template.replace("{input}", query)
+            hub_prompt = AgentPromptCreator.fill_placeholders(hub_prompt_template, input=query)
             
             logger.info(f"Executing hub agent: {hub_agent_name}")
             
@@ -458,24 +536,27 @@ Context:
             
             # Then, each spoke agent processes with the hub's output
             for i, agent in enumerate(spoke_agents):
-                agent_name = agent.get("name", f"agent_{uuid.uuid4().hex[:8]}")
+                agent_name = agent.get("name") or f"agent_{i}"
                 agent_role = agent.get("role", "spoke")
                 agent_prompt_template = agent.get("prompt_template", "")
                 agent_system_message = agent.get("system_message", "")
                 
-                # Replace placeholders in prompt template
-                agent_prompt = agent_prompt_template.replace("{input}", query)
-                agent_prompt = agent_prompt.replace("{hub_output}", hub_output)
-
-                # Check if agent has RAG capabilities
+                # Check if agent has RAG capabilities (skipped when the template can't use the result)
                 agent_tools = agent.get("tools", [])
-                if agent_tools and "retrieve_information" in agent_tools:
+                if agent_tools and "retrieve_information" in agent_tools and "{retrieved_information}" in agent_prompt_template:
                     # Agent has RAG capabilities, retrieve relevant information
                     logger.info(f"Spoke agent {agent_name} is using RAG capabilities")
-                    rag_results = await self.execute_tool("retrieve_information", query=query, num_results=5)
-                    agent_prompt = agent_prompt.replace("{retrieved_information}", rag_results)
+                    rag_results = await self._cached_retrieve(query, 5)
                 else:
-                    agent_prompt = agent_prompt.replace("{retrieved_information}", "No information retrieved")
+                    rag_results = "No information retrieved"
+                
+                # Replace placeholders in prompt template
+                agent_prompt = AgentPromptCreator.fill_placeholders(
+                    agent_prompt_template,
+                    input=query,
+                    hub_output=hub_output,
+                    retrieved_information=rag_results
+                )
                     
                 logger.info(f"Executing spoke agent: {agent_name}")
                 
@@ -509,10 +590,12 @@ Context:
                 pass
             
             # Finally, hub synthesizes all outputs
-            final_prompt = f"Synthesize all outputs to provide a final answer to the query: '{query}'\n\n"
-            final_prompt += "Your previous analysis:\n" + hub_output + "\n\n"
-            final_prompt += "Other agents' analyses:\n"
-            final_prompt += "\n\n".join([f"{name}: {output}" for name, output in agent_outputs.items() if name != hub_agent_name])
+            final_prompt = "".join([
+                f"Synthesize all outputs to provide a final answer to the query: '{query}'\n\n",
+                "Your previous analysis:\n", hub_output, "\n\n",
+                "Other agents' analyses:\n",
+                "\n\n".join([f"{name}: {output}" for name, output in agent_outputs.items() if name != hub_agent_name])
+            ])
             
             final_response = await self.llm_provider.generate_response(
                 provider_name=hub_agent.get("model_provider", "vertex_ai"),
@@ -532,12 +615,83 @@ Context:
             "agent_usage": agent_usage
         }
 
+    @staticmethod
+    def _tokenize_output(text: str) -> Dict[str, Any]:
+        """Create a convergence history entry; the token set is computed on first use and cached on it"""
+        return {
+            "output": text,
+            "_tokens": None,
+            "_len": len(text)
+        }
+    
+    @staticmethod
+    def _entry_tokens(entry: Dict[str, Any]) -> frozenset:
+        """Get the cached token set of a history entry, tokenizing it on first use"""
+        tokens = entry["_tokens"]
+        if tokens is None:
+            tokens = entry["_tokens"] = frozenset(entry["output"].casefold().split())
+        return tokens
+    
+    @classmethod
+    def _calculate_difference(
+        cls,
+        current: Dict[str, Any],
+        previous: Dict[str, Any],
+        threshold: Optional[float] = None
+    ) -> float:
+        """
+        Difference between two history entries in [0, 1], weighting length change and word overlap equally.
+        When a threshold is given and the length change alone exceeds it, that partial score is
+        returned without comparing words.
+        """
+        if current["output"] == previous["output"]:
+            return 0.0
+        
+        current_len, previous_len = current["_len"], previous["_len"]
+        len_diff = abs(current_len - previous_len) / max(current_len, previous_len)
+        if threshold is not None and 0.5 * len_diff > threshold:
+            return 0.5 * len_diff
+        
+        current_tokens = cls._entry_tokens(current)
+        previous_tokens = cls._entry_tokens(previous)
+        max_tokens = max(len(current_tokens), len(previous_tokens))
+        word_similarity = len(current_tokens & previous_tokens) / max_tokens if max_tokens else 1.0
+        
+        return 0.5 * len_diff + 0.5 * (1 - word_similarity)
+    
+    def _check_convergence(
+        self,
+        current_entries: Dict[str, Dict[str, Any]],
+        previous_entries: Dict[str, Dict[str, Any]],
+        threshold: float
+    ) -> bool:
+        """Check whether every agent's output is within threshold of its previous output"""
+        # Cheap length check for every agent first, so a clearly divergent output
+        # ends the check before any text is tokenized
+        pending = []
+        get_previous = previous_entries.get
+        for name, entry in current_entries.items():
+            previous = get_previous(name)
+            if previous is None:
+                return False
+            current_len, previous_len = entry["_len"], previous["_len"]
+            max_len = max(current_len, previous_len)
+            if max_len and 0.5 * abs(current_len - previous_len) / max_len > threshold:
+                return False
+            pending.append((entry, previous))
+        
+        calculate_difference = self._calculate_difference
+        for entry, previous in pending:
+            if calculate_difference(entry, previous, threshold) > threshold:
+                return False
+        return True
+
     async def save_execution_checkpoint(self, execution_id: uuid.UUID, state: Dict[str, Any], checkpoint_dir: str = None) -> str:
         """Save execution state to a checkpoint file"""
         if checkpoint_dir is None:
             checkpoint_dir = settings.CHECKPOINT_DIR
         
-        os.makedirs(checkpoint_dir, exist_ok=True)
+        ensure_dir(checkpoint_dir)
         
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         filename = f"{execution_id}_{timestamp}.json"
@@ -575,6 +729,23 @@ Context:
             logger.error(f"Error executing tool {tool_name}: {str(e)}")
             return f"Error executing tool {tool_name}: {str(e)}"
             
+    async def _cached_retrieve(self, query: str, num_results: int) -> Any:
+        """Retrieve information once per (query, num_results) within the current workflow run"""
+        cache = self._current_rag_cache
+        if cache is None:
+            return await self.execute_tool("retrieve_information", query=query, num_results=num_results)
+        
+        # Store the task rather than the result so concurrent callers share one in-flight lookup
+        key = (query, num_results)
+        task = cache.get(key)
+        if task is None:
+            task = asyncio.ensure_future(
+                self.execute_tool("retrieve_information", query=query, num_results=num_results)
+            )
+            cache[key] = task
+        
+        return await task
+            
     def register_tool(self, name: str, func):
         """Register a new tool function"""
         self.registered_tools[name] = func
@@ -8,6 +8,8 @@ from app.api.public import router as public_router
 from app.core.config import settings
 from app.db.session import engine
 from app.db.models import Base
+from app.engine.llm_providers import llm_provider_manager
+from app.engine.agentic_workflow_engine import close_idle_runners
 
 # Initialize FastAPI app
 app = FastAPI(
@@ -40,6 +42,25 @@ else:
 def create_tables():
     Base.metadata.create_all(bind=engine)
 
+# Background writer for execution result logs
+@app.on_event("startup")
+async def start_log_writer():
+    agentic.start_log_writer()
+
+@app.on_event("shutdown")
+async def stop_log_writer():
+    await agentic.stop_log_writer()
+
+# Checkpoint connections of pooled workflow runners
+@app.on_event("shutdown")
+async def close_workflow_runners():
+    await close_idle_runners()
+
+# Shared LLM provider HTTP connections
+@app.on_event("shutdown")
+async def close_llm_clients():
+    await llm_provider_manager.aclose()
+
 # Health check endpoint
 @app.get("/health")
 async def health_check():
@@ -69,4 +90,13 @@ async def global_exception_handler(request, exc):
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    
+    # Workflow execution fans out many concurrent LLM calls; uvloop's libuv-based
+    # event loop keeps task-switching overhead low (falls back to asyncio if missing)
+    try:
+        import uvloop
+        loop = "uvloop"
+    except ImportError:
+        loop = "asyncio"
+    
+    uvicorn.run(app, host="0.0.0.0", port=8000, loop=loop)
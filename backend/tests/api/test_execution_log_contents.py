@@ -0,0 +1,58 @@
+# backend/tests/api/test_execution_log_contents.py
+import uuid
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.api import agentic
+from app.db.models import Base, ExecutionLog, LogContent
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    try:
+        yield session
+    finally:
+        session.close()
+        engine.dispose()
+
+def write_and_read(db, result):
+    """Write a result's logs, then read them back the way the execution endpoint does"""
+    execution_id = uuid.uuid4()
+    agentic._add_execution_result_logs(db, execution_id, result)
+    db.commit()
+    db.expire_all()
+
+    logs = db.query(ExecutionLog).filter(ExecutionLog.execution_id == execution_id).all()
+    agentic._resolve_log_contents(db, logs)
+    return {log.agent: log.data for log in logs if log.message.startswith("Agent output")}
+
+def test_outputs_round_trip_through_log_contents(db):
+    result = {"success": True, "outputs": {"a": "same answer", "b": "same answer", "c": {"score": 3}}}
+
+    outputs = write_and_read(db, result)
+
+    assert outputs == {"a": {"content": "same answer"}, "b": {"content": "same answer"}, "c": {"content": {"score": 3}}}
+    # Identical string outputs share one stored row; non-string outputs stay inline
+    assert db.query(LogContent).count() == 1
+
+def test_repeated_content_across_executions_is_stored_once(db):
+    write_and_read(db, {"success": True, "outputs": {"a": "shared"}})
+    outputs = write_and_read(db, {"success": True, "outputs": {"a": "shared", "b": "new"}})
+
+    assert outputs == {"a": {"content": "shared"}, "b": {"content": "new"}}
+    assert db.query(LogContent).count() == 2
+
+def test_prune_keeps_only_referenced_contents(db):
+    write_and_read(db, {"success": True, "outputs": {"a": "shared", "b": "only first"}})
+    write_and_read(db, {"success": True, "outputs": {"a": "shared"}})
+    first_execution = db.query(ExecutionLog.execution_id).filter(ExecutionLog.agent == "b").scalar()
+
+    db.query(ExecutionLog).filter(ExecutionLog.execution_id == first_execution).delete()
+    assert agentic._prune_log_contents(db) == 1
+
+    assert [content for (content,) in db.query(LogContent.content)] == ["shared"]
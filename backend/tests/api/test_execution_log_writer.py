@@ -0,0 +1,48 @@
+# backend/tests/api/test_execution_log_writer.py
+import asyncio
+
+from app.api import agentic
+
+def run_with_writer(monkeypatch, body, queue_size=agentic.LOG_QUEUE_SIZE):
+    """Run body() with a fresh log queue and writer, recording the batches it writes"""
+    written = []
+    monkeypatch.setattr(agentic, "_write_queued_result_logs", lambda items: written.append(list(items)))
+    monkeypatch.setattr(agentic, "_log_writer_task", None)
+
+    async def run():
+        monkeypatch.setattr(agentic, "_log_queue", asyncio.Queue(maxsize=queue_size))
+        await body()
+
+    asyncio.run(run())
+    return written
+
+def test_enqueue_without_writer_falls_back(monkeypatch):
+    monkeypatch.setattr(agentic, "_log_writer_task", None)
+
+    assert agentic._enqueue_result_logs("exec-1", {"success": True}) is False
+
+def test_writer_flushes_queued_logs_on_stop(monkeypatch):
+    async def body():
+        agentic.start_log_writer()
+        assert agentic._enqueue_result_logs("exec-1", {"success": True})
+        assert agentic._enqueue_result_logs("exec-2", {"success": False})
+        await agentic.stop_log_writer()
+
+    written = run_with_writer(monkeypatch, body)
+
+    assert [execution_id for batch in written for execution_id, _ in batch] == ["exec-1", "exec-2"]
+    assert agentic._log_writer_task is None
+
+def test_full_queue_falls_back_to_inline_writes(monkeypatch):
+    results = []
+
+    async def body():
+        agentic.start_log_writer()
+        results.append(agentic._enqueue_result_logs("exec-1", {}))
+        # The writer hasn't run yet, so the single slot is still taken
+        results.append(agentic._enqueue_result_logs("exec-2", {}))
+        await agentic.stop_log_writer()
+
+    run_with_writer(monkeypatch, body, queue_size=1)
+
+    assert results == [True, False]
@@ -0,0 +1,6 @@
+# backend/tests/conftest.py
+import os
+
+# Settings are required at import time; tests that need a database set up their own
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+os.environ.setdefault("DATABASE_URL", "sqlite:///:memory:")
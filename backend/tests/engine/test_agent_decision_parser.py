@@ -0,0 +1,67 @@
+# backend/tests/engine/test_agent_decision_parser.py
+import pytest
+
+from app.engine import agent_decision_parser
+from app.engine.agent_decision_parser import AgentDecisionParser, action_annotations_end, find_mentioned_agents
+
+CONTEXT = {"available_agents": ["researcher", "writer"]}
+
+def parse(content):
+    return AgentDecisionParser.parse_agent_decision(content, "boss", "supervisor", CONTEXT)
+
+def test_json_delegation_keeps_known_targets_in_order():
+    decision = parse('{"action_type": "delegate", "targets": ["writer", "nobody", "researcher", "writer"], "content": "go"}')
+
+    assert decision.action_type == "delegate"
+    assert decision.targets == ["writer", "researcher"]
+    assert decision.content == "go"
+
+def test_json_delegation_accepts_single_target():
+    decision = parse('{"action_type": "delegate", "target": "writer"}')
+
+    assert decision.targets == ["writer"]
+
+@pytest.mark.parametrize("targets", ['"writer"', '[["writer"]]', '[{"name": "writer"}]', '{"writer": 1}'])
+def test_json_delegation_rejects_malformed_targets(targets):
+    decision = parse(f'{{"action_type": "delegate", "targets": {targets}}}')
+
+    assert decision.action_type != "delegate"
+
+def test_json_final_decision():
+    decision = parse('{"action_type": "final", "content": "all done"}')
+
+    assert decision.action_type == "final"
+    assert decision.content == "all done"
+
+def test_non_decision_json_falls_through():
+    decision = parse('{"answer": 42}')
+
+    assert decision.action_type == "respond"
+
+def test_action_annotation_delegation():
+    decision = parse("[ACTION: delegate to researcher] [ACTION: delegate to writer]\nPlease look into it")
+
+    assert decision.action_type == "delegate"
+    assert decision.targets == ["researcher", "writer"]
+
+def test_tool_parameters_are_parsed_as_json():
+    decision = parse('[TOOL: search] {"query": "x", "limit": 3}')
+
+    assert decision.action_type == "use_tool"
+    assert decision.tool_params == {"query": "x", "limit": 3}
+
+def test_action_annotations_end():
+    content = "[ACTION: delegate to writer]\nDraft the summary"
+
+    assert action_annotations_end(content) == content.index("\n")
+    assert action_annotations_end("[ACTION: final] done") is None
+
+@pytest.mark.parametrize("use_automaton", [True, False])
+def test_find_mentioned_agents(monkeypatch, use_automaton):
+    if use_automaton and not agent_decision_parser.AHOCORASICK_AVAILABLE:
+        pytest.skip("pyahocorasick is not installed")
+    monkeypatch.setattr(agent_decision_parser, "AHOCORASICK_AVAILABLE", use_automaton)
+
+    found = find_mentioned_agents("Ask the Researcher, then the writer-bot.", ["researcher", "writer", "editor", ""])
+
+    assert found == {"researcher", "writer"}
@@ -0,0 +1,25 @@
+# backend/tests/engine/test_agent_prompt_creator.py
+import pytest
+
+from app.engine.agent_prompt_creator import AgentPromptCreator
+
+@pytest.mark.parametrize("template, expected", [
+    ("Q: {input}", "Q: What is X?"),
+    ("{input} / {unknown}", "What is X? / {unknown}"),
+    ('Answer as JSON like {"answer": "..."}: {input}', 'Answer as JSON like {"answer": "..."}: What is X?'),
+    ("{input:>5} {input}", "{input:>5} What is X?"),
+    ("{{literal}} {input}", "{{literal}} What is X?"),
+    ("no placeholders", "no placeholders"),
+])
+def test_fill_placeholders_matches_chained_replace(template, expected):
+    filled = AgentPromptCreator.fill_placeholders(template, input="What is X?", context="")
+
+    assert filled == expected
+    assert filled == template.replace("{input}", "What is X?").replace("{context}", "")
+
+def test_render_compiled_placeholders():
+    chunks = AgentPromptCreator.compile_placeholders("{input} then {worker_outputs} and {other}")
+
+    rendered = AgentPromptCreator.render_placeholders(chunks, {"input": "Q", "worker_outputs": 1})
+
+    assert rendered == "Q then 1 and {other}"
@@ -0,0 +1,71 @@
+# backend/tests/engine/test_agentic_workflow_engine.py
+import asyncio
+from collections import OrderedDict
+
+import pytest
+
+from app.engine import agentic_workflow_engine
+from app.engine.agentic_workflow_engine import AgenticWorkflowEngine
+
+class FakeRunner:
+    def __init__(self, template=None, workflow=None):
+        self.closed = False
+
+    async def aclose(self):
+        self.closed = True
+
+@pytest.fixture
+def engine(monkeypatch):
+    monkeypatch.setattr(agentic_workflow_engine, "_idle_runners", OrderedDict())
+    monkeypatch.setattr(agentic_workflow_engine, "LangGraphWorkflowRunner", FakeRunner)
+    # The pool methods don't use the engine's tools or vector store
+    return AgenticWorkflowEngine.__new__(AgenticWorkflowEngine)
+
+def test_released_runner_is_reused(engine):
+    runner = engine._acquire_runner("wf", None, None)
+    asyncio.run(engine._release_runner("wf", runner))
+
+    assert engine._acquire_runner("wf", None, None) is runner
+    assert engine._acquire_runner("wf", None, None) is not runner
+
+def test_runners_without_a_key_are_closed(engine):
+    runner = engine._acquire_runner(None, None, None)
+    asyncio.run(engine._release_runner(None, runner))
+
+    assert runner.closed
+    assert not agentic_workflow_engine._idle_runners
+
+def test_pool_is_bounded_per_workflow(engine, monkeypatch):
+    monkeypatch.setattr(agentic_workflow_engine, "MAX_IDLE_RUNNERS_PER_WORKFLOW", 2)
+    runners = [FakeRunner() for _ in range(3)]
+
+    async def release_all():
+        for runner in runners:
+            await engine._release_runner("wf", runner)
+
+    asyncio.run(release_all())
+
+    assert agentic_workflow_engine._idle_runners["wf"] == runners[:2]
+    assert runners[2].closed
+
+def test_least_recently_used_workflows_are_evicted(engine, monkeypatch):
+    monkeypatch.setattr(agentic_workflow_engine, "MAX_POOLED_WORKFLOWS", 2)
+    runners = {key: FakeRunner() for key in ("a", "b", "c")}
+
+    async def release_all():
+        for key, runner in runners.items():
+            await engine._release_runner(key, runner)
+
+    asyncio.run(release_all())
+
+    assert list(agentic_workflow_engine._idle_runners) == ["b", "c"]
+    assert runners["a"].closed
+
+def test_close_idle_runners(engine):
+    runner = FakeRunner()
+    asyncio.run(engine._release_runner("wf", runner))
+
+    asyncio.run(agentic_workflow_engine.close_idle_runners())
+
+    assert runner.closed
+    assert not agentic_workflow_engine._idle_runners
@@ -0,0 +1,314 @@
+# backend/tests/engine/test_langgraph_workflow_runner.py
+import asyncio
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+from app.engine import langgraph_workflow_runner
+from app.engine.langgraph_workflow_runner import LangGraphWorkflowRunner
+from app.engine.optimizations import LRUCache
+
+class FakeLLM:
+    """Scripted stand-in for the LLM provider manager, keyed by model name"""
+
+    def __init__(self, script):
+        self.script = script
+        self.calls = []
+
+    async def generate_response(self, provider_name, model_name, prompt, **kwargs):
+        self.calls.append(model_name)
+        reply = self.script.get(model_name)
+        if isinstance(reply, Exception):
+            raise reply
+        if isinstance(reply, dict):
+            return reply
+        return {"content": reply(prompt) if callable(reply) else (reply or f"answer from {model_name}")}
+
+    async def generate_response_batch(self, requests):
+        return await asyncio.gather(*[self.generate_response(**request) for request in requests])
+
+    def schedule_prewarm(self, provider_name):
+        pass
+
+# What the provider manager returns when a model call fails
+PROVIDER_ERROR = {"content": "Error generating response: timeout", "error": "timeout"}
+
+@pytest.fixture(autouse=True)
+def fresh_caches(monkeypatch):
+    """Keep cached responses from leaking between tests"""
+    monkeypatch.setattr(langgraph_workflow_runner, "routing_cache", LRUCache())
+    monkeypatch.setattr(langgraph_workflow_runner, "response_cache", LRUCache())
+
+def run_workflow(tmp_path, workflow_type, config, script, query="What is X?", workflow_config=None):
+    template = SimpleNamespace(workflow_type=workflow_type, config=config)
+    workflow = SimpleNamespace(config=workflow_config or {})
+    runner = LangGraphWorkflowRunner(template, workflow)
+    runner.checkpoint_dir = str(tmp_path)
+    runner.llm_provider = FakeLLM(script)
+
+    async def execute():
+        try:
+            return await asyncio.wait_for(runner.execute({"query": query}), timeout=30)
+        finally:
+            await runner.aclose()
+            await langgraph_workflow_runner.close_checkpointers()
+
+    return runner, asyncio.run(execute())
+
+def supervisor_config(max_iterations=6, workers=("a", "b")):
+    return {
+        "supervisor": {"name": "boss", "model_name": "boss", "prompt_template": "Q: {input}"},
+        "workers": [{"name": name, "model_name": name, "prompt_template": "{input}"} for name in workers],
+        "workflow_config": {"max_iterations": max_iterations}
+    }
+
+def delegate_once(*targets):
+    """Supervisor script that delegates on its first turn and finishes on the next"""
+    turns = {"count": 0}
+
+    def reply(prompt):
+        turns["count"] += 1
+        if turns["count"] == 1:
+            return " ".join(f"[ACTION: delegate to {target}]" for target in targets)
+        return "[ACTION: final] done"
+
+    return reply
+
+def test_supervisor_fans_out_and_finishes(tmp_path):
+    runner, result = run_workflow(tmp_path, "supervisor", supervisor_config(), {"boss": delegate_once("a", "b")})
+
+    assert result["final_output"] == "[ACTION: final] done"
+    assert result["execution_graph"]["boss"] == ["a", "b"]
+    assert sorted(runner.llm_provider.calls) == ["a", "b", "boss", "boss"]
+
+def test_supervisor_sees_every_fan_out_report(tmp_path):
+    prompts = []
+    decide = delegate_once("a", "b")
+
+    def boss(prompt):
+        prompts.append(prompt)
+        return decide(prompt)
+
+    script = {"boss": boss, "a": "A RESULT", "b": "B RESULT"}
+    run_workflow(tmp_path, "supervisor", supervisor_config(), script)
+
+    assert "Message from a:\nA RESULT" in prompts[1]
+    assert "Message from b:\nB RESULT" in prompts[1]
+
+def test_failing_worker_returns_to_supervisor(tmp_path):
+    script = {"boss": delegate_once("a"), "a": RuntimeError("provider down")}
+    runner, result = run_workflow(tmp_path, "supervisor", supervisor_config(), script)
+
+    assert result["final_output"] == "[ACTION: final] done"
+    assert runner.llm_provider.calls == ["boss", "a", "boss"]
+    assert any(entry.get("action") == "error" and entry["agent"] == "a" for entry in result["history"])
+
+def test_failing_fan_out_branch_leaves_siblings_intact(tmp_path):
+    script = {"boss": delegate_once("a", "b"), "a": RuntimeError("provider down")}
+    runner, result = run_workflow(tmp_path, "supervisor", supervisor_config(), script)
+
+    assert result["outputs"]["a"] == "Error: provider down"
+    assert result["outputs"]["b"] == "answer from b"
+    assert result["final_output"] == "[ACTION: final] done"
+
+def test_failing_worker_is_bounded_by_max_iterations(tmp_path):
+    # The supervisor keeps delegating to a worker that always fails
+    script = {"boss": "[ACTION: delegate to a]", "a": RuntimeError("provider down")}
+    runner, result = run_workflow(tmp_path, "supervisor", supervisor_config(max_iterations=4), script)
+
+    # The turn that exceeds the limit still runs, then the workflow is forced to final
+    assert len(runner.llm_provider.calls) <= 5
+    assert result["final_output"]
+    assert any(entry.get("action") == "max_iterations_reached" for entry in result["history"])
+
+def test_failing_entry_agent_ends_workflow(tmp_path):
+    config = {"agents": [{"name": "x", "model_name": "x"}, {"name": "y", "model_name": "y"}],
+              "workflow_config": {"interaction_type": "sequential", "max_iterations": 5}}
+    runner, result = run_workflow(tmp_path, "swarm", config, {"x": RuntimeError("provider down")})
+
+    assert runner.llm_provider.calls == ["x"]
+    assert result["final_output"]
+
+def test_max_iterations_forces_final(tmp_path):
+    # Supervisor and worker bounce the work back and forth forever
+    script = {"boss": "[ACTION: delegate to a]", "a": "[ACTION: delegate to boss]"}
+    runner, result = run_workflow(tmp_path, "supervisor", supervisor_config(max_iterations=3), script)
+
+    assert len(runner.llm_provider.calls) == 4
+    assert result["history"][-2]["action"] == "max_iterations_reached"
+
+def test_sequential_swarm_passes_outputs_along(tmp_path):
+    config = {"agents": [{"name": "x", "model_name": "x"},
+                         {"name": "y", "model_name": "y", "prompt_template": "{input} prev={previous_outputs}"}],
+              "workflow_config": {"interaction_type": "sequential", "max_iterations": 5}}
+    runner, result = run_workflow(tmp_path, "swarm", config, {"y": lambda prompt: prompt})
+
+    assert runner.llm_provider.calls == ["x", "y"]
+    assert "answer from x" in result["outputs"]["y"]
+
+def test_agent_usage_can_be_left_out(tmp_path):
+    runner = LangGraphWorkflowRunner(SimpleNamespace(workflow_type="supervisor", config=supervisor_config()), SimpleNamespace(config={}))
+    runner.checkpoint_dir = str(tmp_path)
+    runner.llm_provider = FakeLLM({"boss": "[ACTION: final] done"})
+
+    async def execute():
+        try:
+            return [await runner.execute({"query": "What is X?"}, include_agent_usage=flag) for flag in (True, False)]
+        finally:
+            await langgraph_workflow_runner.close_checkpointers()
+
+    with_usage, without_usage = asyncio.run(execute())
+
+    assert [usage["agent"] for usage in with_usage["agent_usage"]] == ["boss"]
+    assert "agent_usage" not in without_usage
+
+def test_response_cache_is_opt_in(tmp_path):
+    script = {"boss": delegate_once("a"), "a": "[ACTION: final] answer"}
+    runner, _ = run_workflow(tmp_path, "supervisor", supervisor_config(), script)
+
+    assert runner.response_cache_enabled is False
+    assert len(langgraph_workflow_runner.response_cache.cache) == 0
+
+def test_response_cache_skips_provider_errors(tmp_path):
+    config = {**supervisor_config(), "response_cache": {"enabled": True}}
+    runner, _ = run_workflow(tmp_path, "supervisor", config, {"boss": PROVIDER_ERROR, "a": PROVIDER_ERROR})
+
+    assert runner.llm_provider.calls
+    assert len(langgraph_workflow_runner.response_cache.cache) == 0
+
+def test_routing_cache_key_covers_prompt_config():
+    config = supervisor_config()
+    edited = {**config, "supervisor": {**config["supervisor"], "system_message": "Route carefully"}}
+    state = {"agents": {"boss": {}, "a": {}, "b": {}}}
+    messages = [{"role": "user", "content": "What is X?", "from": "user"}]
+
+    keys = {
+        LangGraphWorkflowRunner(SimpleNamespace(workflow_type="supervisor", config=template_config), SimpleNamespace(config={}))
+        ._routing_cache_key("boss", template_config["supervisor"], messages, state)
+        for template_config in (config, edited)
+    }
+
+    assert len(keys) == 2
+
+def routing_cache_config():
+    return {**supervisor_config(), "routing_cache": {"enabled": True}}
+
+def test_routing_cache_is_opt_in(tmp_path):
+    runner, _ = run_workflow(tmp_path, "supervisor", supervisor_config(), {"boss": delegate_once("a")})
+
+    assert runner.routing_cache_enabled is False
+    assert len(langgraph_workflow_runner.routing_cache.cache) == 0
+
+def test_routing_cache_stores_only_delegation_targets(tmp_path):
+    run_workflow(tmp_path, "supervisor", routing_cache_config(), {"boss": delegate_once("a", "b")})
+
+    assert [entry["value"] for entry in langgraph_workflow_runner.routing_cache.cache.values()] == [["a", "b"]]
+
+    # A repeated query is routed from the cached targets; only the final turn calls the supervisor
+    runner, result = run_workflow(tmp_path, "supervisor", routing_cache_config(), {"boss": "[ACTION: final] done"})
+
+    assert sorted(runner.llm_provider.calls) == ["a", "b", "boss"]
+    assert result["final_output"] == "[ACTION: final] done"
+
+def test_routing_cache_skips_final_answers(tmp_path):
+    run_workflow(tmp_path, "supervisor", routing_cache_config(), {"boss": "[ACTION: final] the answer"})
+
+    assert len(langgraph_workflow_runner.routing_cache.cache) == 0
+
+def test_routing_cache_skips_provider_errors(tmp_path):
+    runner, _ = run_workflow(tmp_path, "supervisor", routing_cache_config(), {"boss": PROVIDER_ERROR})
+
+    assert runner.llm_provider.calls[0] == "boss"
+    assert len(langgraph_workflow_runner.routing_cache.cache) == 0
+
+@pytest.mark.skipif(not langgraph_workflow_runner.SQLITE_CHECKPOINT_AVAILABLE, reason="SQLite checkpointer is not installed")
+def test_runners_share_one_checkpointer_and_clean_up_threads(tmp_path):
+    template = SimpleNamespace(workflow_type="supervisor", config=supervisor_config())
+    runners = [LangGraphWorkflowRunner(template, SimpleNamespace(config={})) for _ in range(3)]
+    for runner in runners:
+        runner.checkpoint_dir = str(tmp_path)
+        runner.llm_provider = FakeLLM({"boss": delegate_once("a")})
+
+    async def run():
+        try:
+            await asyncio.gather(*[runner.execute({"query": "What is X?"}) for runner in runners])
+            checkpointer = runners[0].checkpointer
+            async with checkpointer.conn.execute("SELECT COUNT(*) FROM checkpoints") as cursor:
+                (remaining,) = await cursor.fetchone()
+            return checkpointer, remaining
+        finally:
+            await langgraph_workflow_runner.close_checkpointers()
+
+    checkpointer, remaining = asyncio.run(run())
+
+    assert all(runner.checkpointer is checkpointer for runner in runners)
+    assert remaining == 0
+
+def test_history_log_is_opt_in(tmp_path):
+    run_workflow(tmp_path, "supervisor", supervisor_config(), {"boss": delegate_once("a")})
+
+    assert not list(tmp_path.glob("*.history.jsonl"))
+
+def test_history_log_records_full_history(tmp_path):
+    runner, result = run_workflow(
+        tmp_path, "supervisor", supervisor_config(), {"boss": delegate_once("a")},
+        workflow_config={"history_log": True}
+    )
+
+    (log_path,) = tmp_path.glob("*.history.jsonl")
+    assert len(log_path.read_text().splitlines()) == len(result["history"])
+
+@pytest.mark.skipif(not langgraph_workflow_runner.ORJSON_AVAILABLE, reason="orjson is not installed")
+@pytest.mark.parametrize("value", [
+    {"agents": {"a": {"messages": [{"role": "user", "content": "hi"}], "next_agent": None}}, "iteration": 3},
+    {"pair": ("a", "b")},
+    {"data": b"bytes"},
+    {1: "non-string key"},
+    {"when": datetime(2024, 1, 1, 12, 30)},
+    {"ratio": float("inf")},
+])
+def test_checkpoint_serializer_matches_default_serializer(value):
+    serializer = langgraph_workflow_runner.OrjsonCheckpointSerializer()
+    default = langgraph_workflow_runner.JsonPlusSerializer()
+
+    restored = serializer.loads_typed(serializer.dumps_typed(value))
+
+    assert restored == default.loads_typed(default.dumps_typed(value))
+
+@pytest.mark.skipif(not langgraph_workflow_runner.ORJSON_AVAILABLE, reason="orjson is not installed")
+def test_checkpoint_serializer_uses_orjson_for_plain_state():
+    serializer = langgraph_workflow_runner.OrjsonCheckpointSerializer()
+
+    assert serializer.dumps_typed({"history": [{"agent": "a", "timestamp": 1}]})[0] == "orjson"
+    assert serializer.dumps_typed({"pair": ("a", "b")})[0] != "orjson"
+
+def test_merge_agents_appends_messages_and_tools():
+    current = {
+        "boss": {"messages": [{"content": "q"}], "tools_used": ["search"], "next_agent": None},
+        "a": {"messages": [], "tools_used": [], "next_agent": None}
+    }
+    update = {
+        "boss": {"messages": [{"content": "from a"}], "tools_used": ["calc"]},
+        "a": {"next_agent": "boss"}
+    }
+
+    merged = langgraph_workflow_runner._merge_agents(current, update)
+
+    assert [message["content"] for message in merged["boss"]["messages"]] == ["q", "from a"]
+    assert merged["boss"]["tools_used"] == ["search", "calc"]
+    assert merged["a"] == {"messages": [], "tools_used": [], "next_agent": "boss"}
+    # The previous state is left untouched
+    assert current["boss"]["messages"] == [{"content": "q"}]
+
+def test_merge_execution_graph_adds_new_edges_only():
+    merged = langgraph_workflow_runner._merge_execution_graph({"boss": ["a"]}, {"boss": ["a", "b"], "a": ["boss"]})
+
+    assert merged == {"boss": ["a", "b"], "a": ["boss"]}
+
+def test_append_history_keeps_recent_window():
+    window = langgraph_workflow_runner.HISTORY_WINDOW
+    history = langgraph_workflow_runner._append_history([{"n": n} for n in range(window)], [{"n": window}])
+
+    assert len(history) == window
+    assert history[0] == {"n": 1} and history[-1] == {"n": window}
@@ -0,0 +1,161 @@
+# backend/tests/engine/test_llm_providers.py
+import asyncio
+import json
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+from app.core.config import settings
+from app.engine.llm_providers import BATCH_API_MIN_REQUESTS, LLMProviderManager
+
+class FakeChatModel:
+    """Chat model whose agenerate fails for any conversation mentioning "bad" """
+
+    def __init__(self):
+        self.calls = []
+
+    async def agenerate(self, messages, **params):
+        self.calls.append(len(messages))
+        if any("bad" in conversation[-1]["content"] for conversation in messages):
+            raise RuntimeError("invalid request")
+        return SimpleNamespace(generations=[
+            [SimpleNamespace(message=SimpleNamespace(content=f"re: {conversation[-1]['content']}"))]
+            for conversation in messages
+        ])
+
+def make_manager(model):
+    manager = LLMProviderManager.__new__(LLMProviderManager)
+    manager.providers = {"openai": {"models": {"gpt-4o": model}}}
+    manager.http_client = None
+    return manager
+
+def batch_request(prompt):
+    return {"provider_name": "openai", "model_name": "gpt-4o", "prompt": prompt}
+
+def test_batch_sends_each_request_once():
+    model = FakeChatModel()
+    manager = make_manager(model)
+
+    responses = asyncio.run(manager.generate_response_batch([batch_request("one"), batch_request("two")]))
+
+    assert [response["content"] for response in responses] == ["re: one", "re: two"]
+    assert model.calls == [1, 1]
+
+def test_batch_isolates_failing_requests():
+    model = FakeChatModel()
+    manager = make_manager(model)
+
+    responses = asyncio.run(manager.generate_response_batch(
+        [batch_request("one"), batch_request("bad"), batch_request("three")]
+    ))
+
+    assert responses[0] == {"content": "re: one", "model": "openai/gpt-4o"}
+    assert "error" in responses[1]
+    assert responses[2] == {"content": "re: three", "model": "openai/gpt-4o"}
+    # Successful prompts are not sent again
+    assert model.calls == [1, 1, 1]
+
+class FakeBatchAPI:
+    """httpx handler for the OpenAI and Anthropic batch endpoints; batches finish on the second poll"""
+
+    def __init__(self, results):
+        self.results = results
+        self.uploaded = []
+        self.polls = 0
+
+    def __call__(self, request):
+        path = request.url.path
+        if request.method == "POST" and path == "/v1/files":
+            lines = request.content.replace(b"\r\n", b"\n").split(b"\n")
+            self.uploaded = [json.loads(line) for line in lines if line.startswith(b'{"custom_id"')]
+            return httpx.Response(200, json={"id": "file-in"})
+        if request.method == "POST" and path == "/v1/batches":
+            assert json.loads(request.content)["input_file_id"] == "file-in"
+            return httpx.Response(200, json={"id": "batch_openai"})
+        if request.method == "POST" and path == "/v1/messages/batches":
+            self.uploaded = json.loads(request.content)["requests"]
+            return httpx.Response(200, json={"id": "msgbatch_anthropic"})
+        if path == "/v1/batches/batch_openai":
+            self.polls += 1
+            if self.polls == 1:
+                return httpx.Response(200, json={"status": "in_progress"})
+            return httpx.Response(200, json={"status": "completed", "output_file_id": "file-out"})
+        if path == "/v1/messages/batches/msgbatch_anthropic":
+            self.polls += 1
+            if self.polls == 1:
+                return httpx.Response(200, json={"processing_status": "in_progress"})
+            return httpx.Response(200, json={"processing_status": "ended", "results_url": "https://api.anthropic.com/v1/results"})
+        if path in ("/v1/files/file-out/content", "/v1/results"):
+            return httpx.Response(200, text="\n".join(json.dumps(item) for item in self.results))
+        return httpx.Response(404)
+
+def make_batch_manager(monkeypatch, api):
+    monkeypatch.setattr(settings, "OPENAI_API_KEY", "sk-test")
+    monkeypatch.setattr(settings, "ANTHROPIC_API_KEY", "sk-ant-test")
+    manager = make_manager(FakeChatModel())
+    manager.providers["anthropic"] = {"models": {}}
+    manager.http_client = httpx.AsyncClient(transport=httpx.MockTransport(api))
+    manager.batches = {}
+    manager.execution_batches = {}
+    return manager
+
+def openai_result(custom_id, content):
+    return {"custom_id": custom_id, "response": {"body": {"choices": [{"message": {"content": content}}]}}}
+
+def test_openai_batch_round_trip(monkeypatch):
+    prompts = [f"prompt {index}" for index in range(BATCH_API_MIN_REQUESTS)]
+    api = FakeBatchAPI([openai_result(str(index), f"re: {prompt}") for index, prompt in enumerate(prompts[1:], 1)])
+    manager = make_batch_manager(monkeypatch, api)
+
+    async def run():
+        batch_id = await manager.generate_batch("openai", "gpt-4o", prompts, execution_id="exec-1")
+        return batch_id, await manager.poll_batch(batch_id), await manager.poll_batch(batch_id)
+
+    batch_id, pending, results = asyncio.run(run())
+
+    assert batch_id == "batch_openai"
+    assert [item["custom_id"] for item in api.uploaded] == [str(index) for index in range(len(prompts))]
+    assert pending is None
+    assert results["1"] == {"content": "re: prompt 1", "model": "openai/gpt-4o"}
+    assert "error" in results["0"]
+    assert manager.batches == {} and manager.execution_batches == {}
+
+def test_anthropic_batch_polled_without_local_record(monkeypatch):
+    api = FakeBatchAPI([
+        {"custom_id": "0", "result": {"type": "succeeded", "message": {"content": [{"type": "text", "text": "hello"}]}}},
+        {"custom_id": "1", "result": {"type": "errored", "error": {"type": "overloaded_error"}}},
+    ])
+    manager = make_batch_manager(monkeypatch, api)
+
+    async def run():
+        # The batch was submitted before a restart, so only its ID and submission parameters are known
+        polls = [manager.poll_batch("msgbatch_anthropic", "anthropic", "claude", ["0", "1", "2"]) for _ in range(2)]
+        return [await poll for poll in polls]
+
+    pending, results = asyncio.run(run())
+
+    assert pending is None
+    assert results["0"] == {"content": "hello", "model": "anthropic/claude"}
+    assert "overloaded_error" in results["1"]["error"]
+    assert results["2"]["error"] == "no result returned for request"
+
+def test_unknown_batch_needs_provider_and_model(monkeypatch):
+    manager = make_batch_manager(monkeypatch, FakeBatchAPI([]))
+
+    with pytest.raises(ValueError):
+        asyncio.run(manager.poll_batch("batch_openai"))
+
+def test_small_batch_is_generated_locally(monkeypatch):
+    api = FakeBatchAPI([])
+    manager = make_batch_manager(monkeypatch, api)
+
+    async def run():
+        batch_id = await manager.generate_batch("openai", "gpt-4o", ["one", "two"])
+        return batch_id, await manager.poll_batch(batch_id)
+
+    batch_id, results = asyncio.run(run())
+
+    assert batch_id.startswith("local-")
+    assert results == {"0": {"content": "re: one", "model": "openai/gpt-4o"}, "1": {"content": "re: two", "model": "openai/gpt-4o"}}
+    assert api.uploaded == [] and api.polls == 0
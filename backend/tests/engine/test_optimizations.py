@@ -0,0 +1,60 @@
+# backend/tests/engine/test_optimizations.py
+import asyncio
+
+import pytest
+
+from app.engine.optimizations import MicroBatcher
+
+def test_micro_batcher_coalesces_concurrent_items():
+    batches = []
+
+    async def double(items):
+        batches.append(list(items))
+        return [item * 2 for item in items]
+
+    async def run():
+        batcher = MicroBatcher(double, max_wait=0.01)
+        return await asyncio.gather(*[batcher.submit(item) for item in (1, 2, 3)])
+
+    assert asyncio.run(run()) == [2, 4, 6]
+    assert batches == [[1, 2, 3]]
+
+def test_micro_batcher_flushes_at_max_batch_size():
+    batches = []
+
+    async def identity(items):
+        batches.append(list(items))
+        return list(items)
+
+    async def run():
+        batcher = MicroBatcher(identity, max_wait=10, max_batch_size=2)
+        return await asyncio.wait_for(asyncio.gather(batcher.submit(1), batcher.submit(2)), timeout=1)
+
+    assert asyncio.run(run()) == [1, 2]
+    assert batches == [[1, 2]]
+
+def test_micro_batcher_fails_items_without_a_result():
+    async def short(items):
+        return list(items)[:1]
+
+    async def run():
+        batcher = MicroBatcher(short, max_wait=0.01)
+        return await asyncio.wait_for(
+            asyncio.gather(batcher.submit("a"), batcher.submit("b"), return_exceptions=True),
+            timeout=1
+        )
+
+    first, second = asyncio.run(run())
+    assert first == "a"
+    assert isinstance(second, RuntimeError)
+
+def test_micro_batcher_propagates_batch_errors():
+    async def broken(items):
+        raise ValueError("boom")
+
+    async def run():
+        batcher = MicroBatcher(broken, max_wait=0.01)
+        return await batcher.submit(1)
+
+    with pytest.raises(ValueError):
+        asyncio.run(run())
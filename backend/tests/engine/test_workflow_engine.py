@@ -0,0 +1,60 @@
+# backend/tests/engine/test_workflow_engine.py
+import asyncio
+
+import pytest
+
+from app.engine.workflow_engine import WorkflowEngine
+
+class FakeLLM:
+    """Stand-in for the LLM provider manager that answers each agent with the same text"""
+
+    def __init__(self, reply="the same answer"):
+        self.reply = reply
+        self.calls = []
+
+    async def generate_response(self, provider_name, model_name, prompt, **kwargs):
+        self.calls.append(model_name)
+        return {"content": self.reply}
+
+@pytest.fixture
+def engine():
+    engine = WorkflowEngine()
+    engine.llm_provider = FakeLLM()
+    return engine
+
+def swarm_config(**workflow_config):
+    return {
+        "agents": [{"name": "x", "model_name": "x"}, {"name": "y", "model_name": "y"}],
+        "workflow_config": {"interaction_type": "sequential", "max_iterations": 3, **workflow_config}
+    }
+
+def agent_calls(engine):
+    return [name for name in engine.llm_provider.calls if name in ("x", "y")]
+
+def test_sequential_swarm_runs_every_iteration_by_default(engine):
+    asyncio.run(engine.execute_swarm_workflow(swarm_config(), {"query": "What is X?"}))
+
+    # Unchanged outputs don't stop the run unless a convergence threshold is configured;
+    # the last agent also runs the final synthesis
+    assert agent_calls(engine) == ["x", "y"] * 3 + ["y"]
+
+def test_sequential_swarm_stops_on_converged_outputs(engine):
+    asyncio.run(engine.execute_swarm_workflow(swarm_config(convergence_threshold=0.3), {"query": "What is X?"}))
+
+    assert agent_calls(engine) == ["x", "y"] * 2 + ["y"]
+
+def test_calculate_difference():
+    same = WorkflowEngine._tokenize_output("alpha beta gamma")
+    reordered = WorkflowEngine._tokenize_output("gamma beta alpha")
+    different = WorkflowEngine._tokenize_output("delta zeta omega")
+
+    assert WorkflowEngine._calculate_difference(same, WorkflowEngine._tokenize_output("alpha beta gamma")) == 0.0
+    assert WorkflowEngine._calculate_difference(same, reordered) == 0.0
+    assert WorkflowEngine._calculate_difference(same, different) == pytest.approx(0.5)
+
+def test_check_convergence(engine):
+    previous = {"x": WorkflowEngine._tokenize_output("alpha beta gamma")}
+
+    assert engine._check_convergence({"x": WorkflowEngine._tokenize_output("gamma beta alpha")}, previous, 0.3)
+    assert not engine._check_convergence({"x": WorkflowEngine._tokenize_output("something else entirely, much longer")}, previous, 0.3)
+    assert not engine._check_convergence({"y": WorkflowEngine._tokenize_output("alpha beta gamma")}, previous, 0.3)